@@ -0,0 +1,64 @@
+// the limit inputs are set in the browser, the figure update that follows them is the only request
+// a histogram selection or a button press costs
+
+function intervalFromTriggered(histType, buttonIntervals) {
+    var interval = null;
+    var triggered = window.dash_clientside.callback_context.triggered;
+
+    triggered.forEach(function (p) {
+        if (p.value === null || p.value === undefined) {
+            return;
+        }
+        var idDict;
+        try {
+            idDict = JSON.parse(p.prop_id.slice(0, p.prop_id.lastIndexOf(".")));
+        } catch (e) {
+            console.log("intervalFromTriggered failed", p);
+            return;
+        }
+
+        if (idDict.type in buttonIntervals) {
+            interval = buttonIntervals[idDict.type];
+        } else if (idDict.type === histType && p.value.range) {
+            interval = p.value.range.x;
+        }
+    });
+    return interval;
+}
+
+// vote shares are shown with two decimals, votes and states are whole numbers
+function updateLabels(histType, buttonIntervals, scale) {
+    var interval = intervalFromTriggered(histType, buttonIntervals);
+    if (interval === null) {
+        return [window.dash_clientside.no_update, window.dash_clientside.no_update];
+    }
+    return [Math.floor(interval[0] * scale) / scale, Math.ceil(interval[1] * scale) / scale];
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    labels: {
+        state_vote: function () {
+            return updateLabels("state_vote_hist", {
+                dem_win_button: [0, 50], rep_win_button: [50.01, 100],
+                reset_state_button: [0, 100], natl_reset_button: [0, 100]
+            }, 100);
+        },
+        natl_vote: function () {
+            return updateLabels("natl_vote_hist", {
+                dem_natl_vote_win_button: [0, 50], rep_natl_vote_win_button: [50.01, 100],
+                reset_natl_vote_button: [0, 100], natl_reset_button: [0, 100]
+            }, 100);
+        },
+        ec_vote: function () {
+            return updateLabels("ec_vote_hist", {
+                dem_ec_vote_win_button: [0, 268], rep_ec_vote_win_button: [269, 538],
+                reset_ec_vote_button: [0, 538], natl_reset_button: [0, 538]
+            }, 1);
+        },
+        n_states_win: function () {
+            return updateLabels("n_states_win_hist", {
+                reset_n_states_win_button: [0, 51], natl_reset_button: [0, 51]
+            }, 1);
+        }
+    }
+});
@@ -1,105 +1,127 @@
 from data_model import DataModel
-from data_functions import serialize_pd, deserialize_pd
-from app.dash_layout import DashLayout
-import random
+from app.dash_layout import DashLayout, default_selected_states
 import dash
-from dash.dependencies import Input, Output, State, MATCH, ALL
+from dash.dependencies import Input, Output, State, MATCH, ALL, ClientsideFunction
 import state_const
-import numpy as np
 import json
 from datetime import datetime as DateTime
-from flask import session
-from glob import glob
-import data_functions
+from app.session_store import get_session, transaction
+from threading import Lock
+import data_store
 import os
 
 
-data_folder = os.environ["ELECTION_DATA_FOLDER"]
 data_size = int(os.environ.get("DATA_SIZE", 100000))
 
 
-no_update_interval = [dash.no_update, dash.no_update]
+session_fields = [
+    "initialized", "data_model_json", "random_sample_id", "random_sample_mode",
+    "new_random_538_map", "new_average_538_map", "natl_histograms_stale", "selected_states"
+]
+
+# page loads of this worker that resumed a saved session or started a new one
+session_stats = dict(resumed=0, cold_init=0)
+session_stats_lock = Lock()
 
 
 def get_session_dict():
+    session = get_session()
+    session.prefetch(*session_fields)
     if not session.get("initialized", False):
-        return init_session_data()
+        new_session_dict = session.initialize_once("initialized", init_session_data, session_fields)
+        if new_session_dict is not None:
+            return new_session_dict
 
-    print("get", sorted(session.keys()))
+    print("get", session.sid)
+    data_model = DataModel.from_json(session["data_model_json"])
     session_dict = dict(
-        random_data_sample=deserialize_pd(session["random_data_sample"]),
+        random_sample_id=session["random_sample_id"],
+        random_data_sample=data_model.get_sample_by_id(session["random_sample_id"]),
         random_sample_mode=session["random_sample_mode"],
         new_random_538_map=session["new_random_538_map"],
         new_average_538_map=session["new_average_538_map"],
-        reset_button_pressed=session["reset_button_pressed"],
-        data_model=DataModel.from_json(session["data_model_json"])
+        natl_histograms_stale=session.get("natl_histograms_stale", False),
+        selected_states=session.get("selected_states", default_selected_states),
+        data_model=data_model
     )
     return session_dict
 
 
 def set_session_dict(session_dict):
+    session = get_session()
     session["data_model_json"] = session_dict["data_model"].to_json()
-    session["random_data_sample"] = serialize_pd(session_dict["random_data_sample"])
+    session["random_sample_id"] = session_dict["random_sample_id"]
     session["random_sample_mode"] = session_dict["random_sample_mode"]
     session["new_random_538_map"] = session_dict["new_random_538_map"]
     session["new_average_538_map"] = session_dict["new_average_538_map"]
-    session["reset_button_pressed"] = session_dict["reset_button_pressed"]
+    session["natl_histograms_stale"] = session_dict["natl_histograms_stale"]
+    session["selected_states"] = session_dict["selected_states"]
     session["initialized"] = True
-    print("set", sorted(session.keys()))
+    print("set", sorted(session.dirty))
 
 
 def init_session_data():
-    csv_filenames = glob(f"{data_folder}/*.csv")
-    elections_data = data_functions.load_data(csv_filenames)
+    store = data_store.get_store()
     new_session_dict = dict(
-        data_model=DataModel(
-            elections_data.iloc[random.sample(range(len(elections_data)), data_size)]
-        ),
+        data_model=DataModel.from_store(store, store.new_sample_seed(), data_size),
+        random_sample_id=None,
         random_data_sample=None,
         random_sample_mode=False,
         new_random_538_map=False,
         new_average_538_map=False,
-        reset_button_pressed=False
+        natl_histograms_stale=False,
+        selected_states=default_selected_states
     )
     set_session_dict(new_session_dict)
     return new_session_dict
 
 
+@transaction
+def load_session_layout():
+    session = get_session()
+    session.prefetch(*session_fields)
+    # sessions on a retired data version start over, their constraints were set on other simulations
+    resumed = session.get("initialized", False) and \
+        session["data_model_json"]["data_version"] == data_store.get_store().version
+    session_dict = get_session_dict() if resumed else init_session_data()
+    # a new page draws every figure, not only those the last callback of the session left to update
+    data_model = session_dict["data_model"]
+    data_changed = data_model.data_changed
+    data_model.data_changed = True
+    layout = get_dash_layout_builder(session_dict).get_layout()
+    data_model.data_changed = data_changed
+    return layout, resumed
+
+
+def get_session_layout():
+    layout, resumed = load_session_layout()
+    with session_stats_lock:
+        session_stats["resumed" if resumed else "cold_init"] += 1
+    print("layout", get_session().sid, "resumed" if resumed else "cold init")
+    return layout
+
+
+def set_random_sample(session_dict):
+    data_model = session_dict["data_model"]
+    session_dict["random_sample_id"] = data_model.get_random_sample_id()
+    session_dict["random_data_sample"] = data_model.get_sample_by_id(session_dict["random_sample_id"])
+
+
 def get_dash_layout_builder(session_dict):
     return DashLayout(
         data_model=session_dict["data_model"],
         random_data_sample=session_dict["random_data_sample"],
         random_sample_mode=session_dict["random_sample_mode"],
         new_random_538_map=session_dict["new_random_538_map"],
-        new_average_538_map=session_dict["new_average_538_map"]
+        new_average_538_map=session_dict["new_average_538_map"],
+        natl_histograms_open=session_dict.get("natl_histograms_open", True),
+        natl_histograms_stale=session_dict["natl_histograms_stale"],
+        selected_states=session_dict["selected_states"]
     )
 
 
 def set_app_callbacks(app):
 
-    def interval_from_callback_context(context, data_l, btn_vals):
-        changed_props = context.triggered
-        interval = None
-
-        for p in changed_props:
-            id_dict_str, value_str = p["prop_id"].split(".")
-            try:
-                id_dict = json.loads(id_dict_str)
-            except json.JSONDecodeError:
-                print("interval_from_callback_context failed", p)
-                continue
-
-            val = p["value"]
-            if val is None:
-                continue
-
-            if id_dict["type"] in btn_vals:
-                interval = btn_vals[id_dict["type"]]
-            elif id_dict["type"] in data_l:
-                interval = val["range"]["x"]
-
-        return interval
-
     def was_reset_button_pressed(context):
         changed_props = context.triggered
         id_dicts = []
@@ -108,7 +130,6 @@ def set_app_callbacks(app):
             try:
                 id_dict = json.loads(id_dict_str)
             except json.JSONDecodeError:
-                print("interval_from_callback_context failed", p)
                 continue
             if p["value"] is not None:
                 id_dicts.append(id_dict)
@@ -124,7 +145,10 @@ def set_app_callbacks(app):
             return [not is_open]
         return [is_open]
 
-    @app.callback(
+    # the limits are resolved in the browser (assets/label_callbacks.js), the figure update
+    # they trigger is the only request of a selection or a button press
+    app.clientside_callback(
+        ClientsideFunction(namespace="labels", function_name="state_vote"),
         [Output(dict(type="rep_state_vote_lower_limit", state=MATCH), "value"),
          Output(dict(type="rep_state_vote_upper_limit", state=MATCH), "value")],
         [Input(dict(type="natl_reset_button"), "n_clicks"),
@@ -132,25 +156,9 @@ def set_app_callbacks(app):
          Input(dict(type="dem_win_button", state=MATCH), "n_clicks"),
          Input(dict(type="rep_win_button", state=MATCH), "n_clicks"),
          Input(dict(type="reset_state_button", state=MATCH), "n_clicks")])
-    def state_vote_select_update_labels(*args):
-        context = dash.callback_context
-        interval = interval_from_callback_context(
-            context,
-            ["state_vote_hist"],
-            dict(
-                dem_win_button=[0, 50], rep_win_button=[50.01, 100],
-                reset_state_button=[0, 100], natl_reset_button=[0, 100]
-            )
-        )
-        session_dict = get_session_dict()
-        session_dict["reset_button_pressed"] = was_reset_button_pressed(context)
-        set_session_dict(session_dict)
-        if interval is not None:
-            return np.floor(interval[0] * 100) / 100, np.ceil(interval[1] * 100) / 100
-        else:
-            return no_update_interval
 
-    @app.callback(
+    app.clientside_callback(
+        ClientsideFunction(namespace="labels", function_name="natl_vote"),
         [Output(dict(type="rep_natl_vote_lower_limit"), "value"),
          Output(dict(type="rep_natl_vote_upper_limit"), "value")],
         [Input(dict(type="natl_reset_button"), "n_clicks"),
@@ -158,25 +166,9 @@ def set_app_callbacks(app):
          Input(dict(type="dem_natl_vote_win_button"), "n_clicks"),
          Input(dict(type="rep_natl_vote_win_button"), "n_clicks"),
          Input(dict(type="reset_natl_vote_button"), "n_clicks")])
-    def natl_vote_select_update_labels(*args):
-        context = dash.callback_context
-        interval = interval_from_callback_context(
-            context,
-            ["natl_vote_hist"],
-            dict(
-                dem_natl_vote_win_button=[0, 50], rep_natl_vote_win_button=[50.01, 100],
-                reset_natl_vote_button=[0, 100], natl_reset_button=[0, 100]
-            )
-        )
-        session_dict = get_session_dict()
-        session_dict["reset_button_pressed"] = was_reset_button_pressed(context)
-        set_session_dict(session_dict)
-        if interval is not None:
-            return np.floor(interval[0] * 100) / 100, np.ceil(interval[1] * 100) / 100
-        else:
-            return no_update_interval
 
-    @app.callback(
+    app.clientside_callback(
+        ClientsideFunction(namespace="labels", function_name="ec_vote"),
         [Output(dict(type="rep_ec_vote_lower_limit"), "value"),
          Output(dict(type="rep_ec_vote_upper_limit"), "value")],
         [Input(dict(type="natl_reset_button"), "n_clicks"),
@@ -184,56 +176,27 @@ def set_app_callbacks(app):
          Input(dict(type="dem_ec_vote_win_button"), "n_clicks"),
          Input(dict(type="rep_ec_vote_win_button"), "n_clicks"),
          Input(dict(type="reset_ec_vote_button"), "n_clicks")])
-    def ec_vote_select_update_labels(*args):
-        context = dash.callback_context
-        interval = interval_from_callback_context(
-            context,
-            ["ec_vote_hist"],
-            dict(
-                dem_ec_vote_win_button=[0, 268], rep_ec_vote_win_button=[269, 538],
-                reset_ec_vote_button=[0, 538], natl_reset_button=[0, 538]
-            )
-        )
-        session_dict = get_session_dict()
-        session_dict["reset_button_pressed"] = was_reset_button_pressed(context)
-        set_session_dict(session_dict)
-        if interval is not None:
-            return np.floor(interval[0]), np.ceil(interval[1])
-        else:
-            return no_update_interval
 
-    @app.callback(
+    app.clientside_callback(
+        ClientsideFunction(namespace="labels", function_name="n_states_win"),
         [Output(dict(type="rep_n_states_win_lower_limit"), "value"),
          Output(dict(type="rep_n_states_win_upper_limit"), "value")],
         [Input(dict(type="natl_reset_button"), "n_clicks"),
          Input(dict(type="n_states_win_hist"), "selectedData"),
          Input(dict(type="reset_n_states_win_button"), "n_clicks")])
-    def n_states_win_select_update_labels(*args):
-        context = dash.callback_context
-        interval = interval_from_callback_context(
-            context,
-            ["n_states_win_hist"],
-            dict(
-                reset_n_states_win_button=[0, 51], natl_reset_button=[0, 51]
-            )
-        )
-        session_dict = get_session_dict()
-        session_dict["reset_button_pressed"] = was_reset_button_pressed(context)
-        set_session_dict(session_dict)
-        if interval is not None:
-            return np.floor(interval[0]), np.ceil(interval[1])
-        else:
-            return no_update_interval
 
     @app.callback(
         Output(dict(type="states_control_block"), "children"),
         Input(dict(type="states_selector"), "value"))
+    @transaction
     def state_selector_update(selected_states):
         session_dict = get_session_dict()
+        session_dict["selected_states"] = selected_states
         data_model = session_dict["data_model"]
-        for s in state_const.states:
-            if s not in selected_states:
-                data_model.add_state_vote_constraint(s, 0, 1)
+        with data_model.batch():
+            for s in state_const.states:
+                if s not in selected_states:
+                    data_model.add_state_vote_constraint(s, 0, 1)
         layout_builder = get_dash_layout_builder(session_dict)
         blocks = [layout_builder.get_state_block(s) for s in selected_states]
         set_session_dict(session_dict)
@@ -264,17 +227,23 @@ def set_app_callbacks(app):
          Input(dict(type="random_result_button"), "n_clicks"),
          Input(dict(type="average_result_button"), "n_clicks"),
 
-         Input(dict(type="states_control_block"), "children")])
+         Input(dict(type="states_control_block"), "children"),
+
+         Input(dict(type="natl_reset_button"), "n_clicks"),
+
+         Input(dict(type="natl_histograms"), "is_open")])
+    @transaction
     def update_figure(*args):
         session_dict = get_session_dict()
+        session_dict["natl_histograms_open"] = args[-1]
 
         changed_props = dash.callback_context.triggered
         update_data_start_time = DateTime.now()
         data_model = session_dict["data_model"]
 
-        if session_dict["reset_button_pressed"]:
+        # the limits the reset sets arrive in the same request, the reset has to come first
+        if was_reset_button_pressed(dash.callback_context):
             data_model.reset_data()
-            session_dict["reset_button_pressed"] = False
             if session_dict["random_sample_mode"]:
                 session_dict["random_sample_mode"] = False
                 session_dict["new_average_538_map"] = True
@@ -317,7 +286,7 @@ def set_app_callbacks(app):
             elif id_dict["type"] == "random_result_button":
                 session_dict["new_random_538_map"] = True
                 session_dict["random_sample_mode"] = True
-                session_dict["random_data_sample"] = data_model.get_random_sample()
+                set_random_sample(session_dict)
             elif id_dict["type"] == "average_result_button":
                 session_dict["new_average_538_map"] = True
                 session_dict["random_sample_mode"] = False
@@ -326,13 +295,21 @@ def set_app_callbacks(app):
                 # data updated was already handled in state_selector callback
                 pass
 
+            elif id_dict["type"] == "natl_reset_button":
+                # handled before the limits
+                pass
+
+            elif id_dict["type"] == "natl_histograms":
+                # expanded or collapsed, stale national histograms are built once visible
+                pass
+
             else:
                 print("no match", id_dict)
                 continue
 
         # if random data mode and data changed
         if data_model.data_changed and session_dict["random_sample_mode"]:
-            session_dict["random_data_sample"] = data_model.get_random_sample()
+            set_random_sample(session_dict)
 
         dash_payout_builder = get_dash_layout_builder(session_dict)
         print("data update took", DateTime.now() - update_data_start_time)
@@ -341,6 +318,11 @@ def set_app_callbacks(app):
 
         print("figures update took", DateTime.now() - update_figures_start_time)
 
+        if session_dict["natl_histograms_open"]:
+            session_dict["natl_histograms_stale"] = False
+        elif data_model.data_changed:
+            session_dict["natl_histograms_stale"] = True
+
         data_model.data_changed = False
         session_dict["new_random_538_map"] = False
         session_dict["new_average_538_map"] = False
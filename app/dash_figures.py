@@ -1,5 +1,4 @@
 import plotly_figures
-import numpy as np
 import dash
 
 
@@ -19,6 +18,28 @@ state_hist_layout = dict(
     dragmode="select",
 )
 
+map_538_layout = dict(
+    margin=dict(b=0, t=0, l=0, r=0),
+    xaxis=dict(fixedrange=True),
+    yaxis=dict(fixedrange=True),
+    height=400
+)
+bar_538_layout = dict(
+    margin=dict(b=0, t=30, l=0, r=0),
+    height=70
+)
+
+
+# figure dicts are shared skeletons, the layout is copied rather than updated,
+# nested dicts such as the axes are merged one level deep
+def with_layout(fig, layout):
+    new_layout = dict(fig["layout"])
+    for key, value in layout.items():
+        if isinstance(value, dict) and isinstance(new_layout.get(key), dict):
+            value = dict(new_layout[key], **value)
+        new_layout[key] = value
+    return dict(fig, layout=new_layout)
+
 
 class DashFigures:
     def __init__(
@@ -27,95 +48,90 @@ class DashFigures:
             random_data_sample=None,
             random_sample_mode=False,
             new_random_538_map=False,
-            new_average_538_map=False
+            new_average_538_map=False,
+            natl_histograms_open=True,
+            natl_histograms_stale=False
     ):
         self.data_model = data_model
         self.random_data_sample = random_data_sample
         self.random_sample_mode = random_sample_mode
         self.new_random_538_map = new_random_538_map
         self.new_average_538_map = new_average_538_map
+        # the national histograms are only built while their collapse is open, stale when the data
+        # changed while it was closed
+        self.natl_histograms_open = natl_histograms_open
+        self.natl_histograms_stale = natl_histograms_stale
 
     def fig_map_538(self):
         if self.data_model.data_changed or self.new_random_538_map or self.new_average_538_map:
             if self.random_sample_mode:
                 fig = plotly_figures.fig_dem_vote_share(self.random_data_sample.iloc[0])
             else:
-                fig = plotly_figures.fig_chance_dem_win(self.data_model.data)
+                statistics = self.data_model.get_statistics()
+                if statistics.n == 0:
+                    fig = plotly_figures.fig_empty_us_map()
+                else:
+                    fig = plotly_figures.fig_chance_dem_win(None, statistics.chance_dem_win)
         else:
             return dash.no_update
 
-        fig.update_layout(
-            margin=dict(b=0, t=0, l=0, r=0),
-            xaxis=dict(fixedrange=True),
-            yaxis=dict(fixedrange=True),
-            height=400
-        )
-        return fig
+        return with_layout(fig, map_538_layout)
 
     def fig_bar_538(self):
         if self.data_model.data_changed or self.new_random_538_map or self.new_average_538_map:
             if self.random_sample_mode:
                 b_fig = plotly_figures.fig_ec_bar(self.random_data_sample)
             else:
-                b_fig = plotly_figures.fig_ec_bar(self.data_model.data)
+                b_fig = plotly_figures.fig_ec_bar(None, self.data_model.get_statistics().chance_dem_win)
         else:
             return dash.no_update
 
-        b_fig.update_layout(
-            margin=dict(b=0, t=30, l=0, r=0),
-            height=70
-        )
+        return with_layout(b_fig, bar_538_layout)
+
+    # the filtered view, for histograms its statistics do not hold yet
+    def get_data(self):
+        return self.data_model.data
 
-        return b_fig
+    def natl_histograms_need_update(self):
+        return self.natl_histograms_open and (self.data_model.data_changed or self.natl_histograms_stale)
 
     def fig_natl_vote_hist(self):
-        if not self.data_model.data_changed:
+        if not self.natl_histograms_need_update():
             return dash.no_update
-        fig = plotly_figures.fig_rep_natl_vote_hist(self.data_model.data)
-        fig.update_layout(**natl_hist_layout)
-        fig.update_layout(xaxis=dict(ticksuffix="%"))
-        return fig
+        fig = plotly_figures.fig_rep_dem_hist(self.data_model.get_statistics().get_natl_vote_histogram(self.get_data))
+        return with_layout(with_layout(fig, natl_hist_layout), dict(xaxis=dict(ticksuffix="%")))
 
     def fig_ec_vote_hist(self):
-        if not self.data_model.data_changed:
+        if not self.natl_histograms_need_update():
             return dash.no_update
-        fig = plotly_figures.fig_rep_ec_vote_hist(self.data_model.data)
-        fig.update_layout(**natl_hist_layout)
-        return fig
+        fig = plotly_figures.fig_rep_dem_hist(self.data_model.get_statistics().get_ec_vote_histogram(self.get_data))
+        return with_layout(fig, natl_hist_layout)
 
     def fig_n_states_win_hist(self):
-        if not self.data_model.data_changed:
+        if not self.natl_histograms_need_update():
             return dash.no_update
-        fig = plotly_figures.fig_rep_n_states_win_hist(self.data_model.data)
-        fig.update_layout(**natl_hist_layout)
-        return fig
+        histogram = self.data_model.get_statistics().get_n_states_win_histogram(self.get_data)
+        fig = plotly_figures.fig_rep_dem_hist(histogram)
+        return with_layout(fig, natl_hist_layout)
 
     def fig_state_vote_hist(self, state, force=False):
         if not self.data_model.data_changed and not force:
             return dash.no_update
 
-        h_fig = plotly_figures.fig_rep_state_vote_hist(self.data_model.data, state, True)
-        h_fig.update_layout(state_hist_layout)
+        histogram = self.data_model.get_statistics().get_state_vote_histogram(state, self.get_data)
+        h_fig = with_layout(plotly_figures.fig_rep_dem_hist(histogram), state_hist_layout)
 
-        x_min = np.inf
-        x_max = -np.inf
-        for trace_data in h_fig.data:
-            if len(trace_data.x) == 0:
-                continue
-            data_min = min(trace_data.x)
-            data_max = max(trace_data.x)
-            x_min = min(x_min, data_min)
-            x_max = max(x_max, data_max)
+        x_range = h_fig["layout"]["xaxis"]["range"]
 
         # add vertical line
-        if x_min <= 50 <= x_max:
-            h_fig.update_layout(shapes=[
+        if x_range is not None and x_range[0] <= 50 <= x_range[1]:
+            h_fig = with_layout(h_fig, dict(shapes=[
                 dict(
                     type="line",
                     yref="paper", y0=0, y1=1,
                     xref="x", x0=50, x1=50
                 )
-            ])
+            ]))
 
         return h_fig
 
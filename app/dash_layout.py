@@ -26,11 +26,17 @@ bar_538_config = dict(
 zero_hundred_pattern = r"0*(\d?\d(\.\d*)?|100)"
 zero_538_pattern = r"0*(\d?\d|[1-4]\d\d|5[0-2]\d|53[0-8])"
 zero_51 = r"0*(\d|[1-4]\d|5[0-1])"
+default_selected_states = ["AZ", "FL", "GA", "OH", "PA"]
 
 
-def get_average_simulations_summary(data, total_simulations):
-    n = len(data)
-    av_d_ec, (d_win, d_ec), (r_win, r_ec) = data_functions.win_statistics(data)
+# statistics of the data when they were already computed, data is not read then
+def get_average_simulations_summary(data, total_simulations, statistics=None):
+    if statistics is None:
+        n = len(data)
+        av_d_ec, (d_win, d_ec), (r_win, r_ec) = data_functions.win_statistics(data)
+    else:
+        n = statistics.n
+        av_d_ec, (d_win, d_ec), (r_win, r_ec) = statistics.win_statistics
     if total_simulations == 0:
         ratio = np.NaN
     else:
@@ -64,6 +70,15 @@ def get_single_simulations_summary(data):
     return text
 
 
+# the limit inputs show the constraints of the session, vote shares in percent
+def get_percent_limits(interval):
+    return round(float(interval[0]) * 100, 2), round(float(interval[1]) * 100, 2)
+
+
+def get_count_limits(interval):
+    return int(np.floor(interval[0])), int(np.ceil(interval[1]))
+
+
 def add_br(lines):
     if len(lines) == 0:
         return []
@@ -81,19 +96,27 @@ class DashLayout:
         random_data_sample=None,
         random_sample_mode=False,
         new_random_538_map=False,
-        new_average_538_map=False
+        new_average_538_map=False,
+        natl_histograms_open=True,
+        natl_histograms_stale=False,
+        selected_states=None
     ):
         self.data_model = data_model
+        self.selected_states = default_selected_states if selected_states is None else selected_states
         self.random_data_sample = random_data_sample
         self.random_sample_mode = random_sample_mode
         self.new_random_538_map = new_random_538_map
         self.new_average_538_map = new_average_538_map
+        self.natl_histograms_open = natl_histograms_open
+        self.natl_histograms_stale = natl_histograms_stale
         self.dash_figures_builder = DashFigures(
             data_model,
             random_data_sample,
             random_sample_mode,
             new_random_538_map,
-            new_average_538_map
+            new_average_538_map,
+            natl_histograms_open,
+            natl_histograms_stale
         )
 
     def get_layout(self):
@@ -142,7 +165,7 @@ class DashLayout:
             dcc.Dropdown(
                 id=dict(type="states_selector"),
                 options=[dict(label=s, value=s) for s in state_const.states],
-                value=["AZ", "FL", "GA", "OH", "PA"],
+                value=self.selected_states,
                 multi=True
             ),
             html.Div(
@@ -156,6 +179,7 @@ class DashLayout:
         return layout
 
     def get_state_block(self, state_name):
+        lower, upper = get_percent_limits(self.data_model.rep_state_vote_constraints[state_name])
         layout = html.Div([
             html.H5(f"{state_const.state_names_short_to_long[state_name]} Vote"),
             dcc.Graph(
@@ -166,12 +190,12 @@ class DashLayout:
             html.Div([
                 "Trump: from ",
                 dcc.Input(
-                    value=0,
+                    value=lower,
                     id=dict(type="rep_state_vote_lower_limit", state=state_name),
                     type="text", pattern=zero_hundred_pattern, debounce=True, size="3"
                 ), " to ",
                 dcc.Input(
-                    value=100,
+                    value=upper,
                     id=dict(type="rep_state_vote_upper_limit", state=state_name),
                     type="text", pattern=zero_hundred_pattern, debounce=True, size="3"
                 )],
@@ -262,6 +286,7 @@ class DashLayout:
         )
 
     def get_natl_vote_block(self):
+        lower, upper = get_percent_limits(self.data_model.rep_natl_vote_constraint)
         layout = html.Div([
             html.H5("National Popular Vote"),
             dcc.Graph(
@@ -272,12 +297,12 @@ class DashLayout:
             html.Div([
                 "Trump: from ",
                 dcc.Input(
-                    value=0,
+                    value=lower,
                     id=dict(type="rep_natl_vote_lower_limit"),
                     type="text", pattern=zero_hundred_pattern, debounce=True, size="3"
                 ), " to ",
                 dcc.Input(
-                    value=100,
+                    value=upper,
                     id=dict(type="rep_natl_vote_upper_limit"),
                     type="text", pattern=zero_hundred_pattern, debounce=True, size="3"
                 )],
@@ -313,6 +338,7 @@ class DashLayout:
         return layout
 
     def get_ec_vote_block(self):
+        lower, upper = get_count_limits(self.data_model.rep_ec_vote_constraint)
         layout = html.Div([
             html.H5("Electoral College Vote"),
             dcc.Graph(
@@ -323,12 +349,12 @@ class DashLayout:
             html.Div([
                 "Trump: from ",
                 dcc.Input(
-                    value=0,
+                    value=lower,
                     id=dict(type="rep_ec_vote_lower_limit"),
                     type="text", pattern=zero_538_pattern, debounce=True, size="3"
                 ), " to ",
                 dcc.Input(
-                    value=538,
+                    value=upper,
                     id=dict(type="rep_ec_vote_upper_limit"),
                     type="text", pattern=zero_538_pattern, debounce=True, size="3"
                 )],
@@ -365,6 +391,7 @@ class DashLayout:
         return layout
 
     def get_n_states_win_block(self):
+        lower, upper = get_count_limits(self.data_model.rep_states_win_constraint)
         layout = html.Div([
             html.H5("Number Of States Won"),
             dcc.Graph(
@@ -375,12 +402,12 @@ class DashLayout:
             html.Div([
                 "Trump: from ",
                 dcc.Input(
-                    value=0,
+                    value=lower,
                     id=dict(type="rep_n_states_win_lower_limit"),
                     type="text", pattern=zero_51, debounce=True, size="2"
                 ), " to ",
                 dcc.Input(
-                    value=51,
+                    value=upper,
                     id=dict(type="rep_n_states_win_upper_limit"),
                     type="text", pattern=zero_51, debounce=True, size="2"
                 )],
@@ -427,7 +454,9 @@ class DashLayout:
             return dash.no_update
 
     def get_average_summary(self):
-        summary_lines = get_average_simulations_summary(self.data_model.data, len(self.data_model.original_data))
+        summary_lines = get_average_simulations_summary(
+            None, len(self.data_model.original_data), self.data_model.get_statistics()
+        )
         summary_br = add_br(summary_lines)
 
         natl_vote_text = [
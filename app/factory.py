@@ -1,26 +1,48 @@
-from flask import Flask, session
+from flask import Flask, Response, jsonify
+from plotly.utils import PlotlyJSONEncoder
 import dash
 import dash_bootstrap_components as dbc
-from app.dash_callbacks import set_app_callbacks
+from app.dash_callbacks import set_app_callbacks, get_session_layout, session_stats, session_stats_lock
 from app.dash_layout import DashLayout
 from app.config import SessionConfig
+from app import session_store
+from app import json_encoding
 from data_model import DataModel
-from flask_session import Session
 from state_const import states
+import data_store
 import pandas as pd
 
 
 class DashAppWrapper(dash.Dash):
-    def index(self, *args, **kwargs):
-        print("index", session.keys(), "clear")
-        session.clear()
-        return super().index(*args, **kwargs)
+    # every page load gets the layout of its session, a refresh or a second tab continues where it was,
+    # callbacks are validated against the static layout
+    def serve_layout(self):
+        return Response(
+            json_encoding.dumps(get_session_layout(), cls=PlotlyJSONEncoder),
+            mimetype="application/json"
+        )
 
 
 def build_server():
     server = Flask(__name__)
     server.config.from_object(SessionConfig)
-    Session(server)
+    json_encoding.init_app()
+    session_store.init_app(server, SessionConfig.SESSION_REDIS)
+    # load the simulations once per worker, sessions only sample from the shared store
+    data_store.get_store()
+    # threads do not survive the fork of preloaded gunicorn workers, start watching in the worker
+    server.before_first_request(data_store.start_watcher)
+
+    # hit, miss and eviction counters of the filter result caches of this worker
+    @server.route("/_cache_stats")
+    def cache_stats():
+        return jsonify(data_store.get_store().get_cache_stats())
+
+    # page loads of this worker that resumed a session and that started a new one
+    @server.route("/_session_stats")
+    def get_session_stats():
+        with session_stats_lock:
+            return jsonify(session_stats)
 
     app = DashAppWrapper(
         __name__,
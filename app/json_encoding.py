@@ -0,0 +1,40 @@
+from plotly.utils import PlotlyJSONEncoder
+import dash.dash
+import numpy as np
+import orjson
+import json
+import os
+import sys
+
+
+# encode callback responses with orjson, numpy arrays are written natively instead of
+# element by element, 0 to keep the json module
+fast_json = os.environ.get("FAST_JSON", "1") != "0"
+
+_plotly_encoder = PlotlyJSONEncoder()
+_orjson_options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+loads = json.loads
+
+
+# plotly figures, dash components and anything else the plotly encoder knows,
+# arrays orjson does not take natively (not C contiguous, object dtype) become lists
+def _default(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    return _plotly_encoder.default(obj)
+
+
+# same output as json.dumps with the plotly encoder, NaN and infinities become null
+def dumps(obj, cls=None, **kwargs):
+    try:
+        return orjson.dumps(obj, default=_default, option=_orjson_options).decode()
+    except TypeError:
+        return json.dumps(obj, cls=cls, **kwargs)
+
+
+# dash 1.x serializes callback outputs with json.dumps inside every callback wrapper,
+# the module it calls it on is replaced, that covers every registered callback
+def init_app():
+    if fast_json:
+        dash.dash.json = sys.modules[__name__]
@@ -0,0 +1,252 @@
+from contextlib import contextmanager
+from flask import g, request
+from redis.exceptions import WatchError
+from threading import Lock
+import functools
+import json
+import os
+import random
+import time
+import uuid
+import zlib
+
+
+cookie_name = "election_session"
+session_ttl = int(os.environ.get("SESSION_TTL", 7 * 24 * 3600))
+# field values longer than this are stored zlib compressed
+compress_threshold = int(os.environ.get("SESSION_COMPRESS_THRESHOLD", 1024))
+
+# how long one request may hold the initialization of a session before others take over
+init_lock_timeout = float(os.environ.get("SESSION_INIT_TIMEOUT", 30))
+init_poll_interval = float(os.environ.get("SESSION_INIT_POLL_INTERVAL", 0.05))
+# times a callback is run again on the newer state when another request committed the session first
+commit_retries = int(os.environ.get("SESSION_COMMIT_RETRIES", 10))
+
+# incremented by every commit, a commit only succeeds if the version is still the one the values were read at
+version_field = "_version"
+
+_missing = object()
+
+# requests of this worker that initialize the same session, sid -> (lock, number of requests)
+_init_locks = {}
+_init_locks_lock = Lock()
+
+
+@contextmanager
+def local_init_lock(sid):
+    with _init_locks_lock:
+        lock, n = _init_locks.get(sid, (Lock(), 0))
+        _init_locks[sid] = (lock, n + 1)
+    try:
+        with lock:
+            yield
+    finally:
+        with _init_locks_lock:
+            lock, n = _init_locks[sid]
+            if n == 1:
+                del _init_locks[sid]
+            else:
+                _init_locks[sid] = (lock, n - 1)
+
+
+class SessionConflict(Exception):
+    pass
+
+
+def encode_value(value):
+    raw = json.dumps(value, separators=(",", ":")).encode()
+    if len(raw) > compress_threshold:
+        return b"z" + zlib.compress(raw)
+    return b"j" + raw
+
+
+def decode_value(raw):
+    if raw[:1] == b"z":
+        return json.loads(zlib.decompress(raw[1:]))
+    return json.loads(raw[1:])
+
+
+# session fields live in a redis hash, they are read on first access and only the fields
+# that were changed are written back, in one round trip at the end of the request,
+# the write fails with SessionConflict if another request committed the session after the read
+class SessionUnitOfWork:
+    def __init__(self, redis, sid, is_new=False):
+        self.redis = redis
+        self.sid = sid
+        self.key = f"election_session:{sid}"
+        self.is_new = is_new
+        self.reset()
+
+    # forgets everything read or changed in this request
+    def reset(self):
+        self.raw = {}
+        self.values = {}
+        self.dirty = set()
+        # None until the first read, writes without a read are not checked
+        self.version = None
+        self.stale = False
+
+    def prefetch(self, *fields):
+        missing = [f for f in fields if f not in self.raw]
+        if len(missing) == 0:
+            return
+        if self.is_new:
+            raw_values = [None] * len(missing)
+        else:
+            *raw_values, raw_version = self.redis.hmget(self.key, missing + [version_field])
+            version = 0 if raw_version is None else int(raw_version)
+            if self.version is None:
+                self.version = version
+            elif version != self.version:
+                # fields read earlier in this request are older than these
+                self.stale = True
+        for f, raw in zip(missing, raw_values):
+            self.raw[f] = raw
+            self.values[f] = _missing if raw is None else decode_value(raw)
+
+    def get(self, field, default=None):
+        if field not in self.values:
+            self.prefetch(field)
+        value = self.values[field]
+        return default if value is _missing else value
+
+    def __getitem__(self, field):
+        value = self.get(field, _missing)
+        if value is _missing:
+            raise KeyError(field)
+        return value
+
+    def __setitem__(self, field, value):
+        encoded = encode_value(value)
+        self.values[field] = value
+        if field in self.raw and self.raw[field] == encoded:
+            self.dirty.discard(field)
+        else:
+            self.dirty.add(field)
+            self.raw.pop(field, None)
+
+    # drops the values read so far and reads fields again, fields changed in this request are kept
+    def refresh(self, *fields):
+        self.raw = {f: v for f, v in self.raw.items() if f in self.dirty}
+        self.values = {f: v for f, v in self.values.items() if f in self.dirty}
+        self.version = None
+        self.stale = False
+        self.prefetch(*fields)
+
+    def is_shared(self):
+        return not self.is_new
+
+    def acquire_init_lock(self, token):
+        return self.redis.set(self.key + ":init", token, nx=True, px=int(init_lock_timeout * 1000))
+
+    def release_init_lock(self, token):
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(self.key + ":init")
+                if pipe.get(self.key + ":init") == token.encode():
+                    pipe.multi()
+                    pipe.delete(self.key + ":init")
+                    pipe.execute()
+            except WatchError:
+                pass
+
+    # the first callbacks of a page load arrive together, one of them (across all workers) runs init
+    # and commits its fields, the others wait for ready_field and read the fields it wrote,
+    # returns what init returned, or None when the session was initialized by another request
+    def initialize_once(self, ready_field, init, fields):
+        if not self.is_shared():
+            result = init()
+            self.commit()
+            return result
+
+        with local_init_lock(self.sid):
+            token = uuid.uuid4().hex
+            deadline = time.time() + init_lock_timeout
+            while True:
+                self.refresh(*fields)
+                if self.get(ready_field, False):
+                    return None
+                if self.acquire_init_lock(token) or time.time() > deadline:
+                    break
+                time.sleep(init_poll_interval)
+
+            try:
+                result = init()
+                self.commit()
+            finally:
+                self.release_init_lock(token)
+            return result
+
+    def commit(self):
+        if len(self.dirty) == 0:
+            return
+        if self.stale:
+            raise SessionConflict(self.sid)
+        encoded = {f: encode_value(self.values[f]) for f in self.dirty}
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(self.key)
+                raw_version = pipe.hget(self.key, version_field)
+                version = 0 if raw_version is None else int(raw_version)
+                if self.version is not None and version != self.version:
+                    raise SessionConflict(self.sid)
+                pipe.multi()
+                encoded[version_field] = str(version + 1)
+                pipe.hset(self.key, mapping=encoded)
+                pipe.expire(self.key, session_ttl)
+                pipe.execute()
+            except WatchError:
+                raise SessionConflict(self.sid)
+        del encoded[version_field]
+        self.raw.update(encoded)
+        self.version = version + 1
+        self.dirty = set()
+
+
+def get_session():
+    uow = g.get("session_uow")
+    if uow is None:
+        sid = request.cookies.get(cookie_name)
+        is_new = sid is None
+        if is_new:
+            sid = uuid.uuid4().hex
+        uow = g.session_uow = SessionUnitOfWork(g.session_redis, sid, is_new)
+    return uow
+
+
+# commits the session right after func, if another request committed it first func runs again
+# on the newer state, so func must derive its changes from its arguments and the session only
+def transaction(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(commit_retries + 1):
+            session = get_session()
+            try:
+                result = func(*args, **kwargs)
+                session.commit()
+                return result
+            except SessionConflict:
+                print("session conflict", session.sid, "attempt", attempt)
+                session.reset()
+                time.sleep(random.uniform(0, init_poll_interval))
+        raise SessionConflict(get_session().sid)
+    return wrapper
+
+
+def init_app(server, redis):
+    @server.before_request
+    def open_session():
+        g.session_redis = redis
+        g.session_uow = None
+
+    @server.after_request
+    def commit_session(response):
+        uow = g.get("session_uow")
+        if uow is not None:
+            try:
+                uow.commit()
+            except SessionConflict:
+                print("session conflict", uow.sid, "changes dropped", sorted(uow.dirty))
+            if uow.is_new:
+                response.set_cookie(cookie_name, uow.sid, max_age=session_ttl, httponly=True, samesite="Lax")
+        return response
@@ -0,0 +1,29 @@
+import os
+import time
+import numpy as np
+import data_cache
+import data_functions
+from conftest import make_simulations
+
+
+# the simulations of ELECTION_DATA_FOLDER repeated up to n rows, synthetic ones when it is not set
+def get_simulations(n):
+    folder = os.environ.get("ELECTION_DATA_FOLDER")
+    if folder:
+        data, _, _ = data_cache.load_data(folder)
+        return data.iloc[np.arange(n) % len(data)].reset_index(drop=True)
+    data = make_simulations(n)
+    data["dem_ec"] = data_functions.get_dem_ec(data)
+    data[data_functions.win_mask_column] = data_functions.get_dem_win_mask(data)
+    return data
+
+
+# best of repeat runs in milliseconds, and what the last run returned
+def best_time(func, repeat=5):
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return 1000 * min(times), result
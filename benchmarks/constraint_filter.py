@@ -0,0 +1,63 @@
+import argparse
+import numpy as np
+import data_filters
+import state_const
+from benchmarks.common import best_time, get_simulations
+
+
+# typed state shares, a win button, the national vote and the electoral votes, as republican shares
+constraint_sets = {
+    "3 states": (dict(PA=(0.45, 0.55), GA=(0.47, 1), AZ=(0.46, 0.53)),),
+    "3 states, ec": (dict(PA=(0.45, 0.55), GA=(0.47, 1), AZ=(0.46, 0.53)), (0, 1), (270, 538)),
+    "win button, natl": (dict(FL=(0.5001, 1)), (0.45, 0.49)),
+    "natl, ec, states won": ({}, (0.46, 0.5), (200, 300), (20, 30)),
+}
+
+
+# the filter of DataModel before the combined mask: two .loc copies per constraint, for every state
+# whether it is constrained or not, then the electoral votes, the national vote and the states won
+def filter_loc_chain(data, rep_state_vote_constraints, natl=(0, 1), ec=(0, 538), n_states=(0, 51)):
+    for s in state_const.states:
+        f, t = rep_state_vote_constraints.get(s, (0, 1))
+        data = data.loc[f <= (1 - data[s])]
+        data = data.loc[(1 - data[s]) <= t]
+    data = data.loc[ec[0] <= (538 - data["dem_ec"])]
+    data = data.loc[(538 - data["dem_ec"]) <= ec[1]]
+    data = data.loc[natl[0] <= (1 - data["natl_pop_vote"])]
+    data = data.loc[(1 - data["natl_pop_vote"]) <= natl[1]]
+    n_rep_states_won = 51 - (data[state_const.states] >= 0.5).sum(axis=1)
+    data = data.loc[n_states[0] <= n_rep_states_won]
+    n_rep_states_won = 51 - (data[state_const.states] >= 0.5).sum(axis=1)
+    data = data.loc[n_rep_states_won <= n_states[1]]
+    return data
+
+
+def filter_combined_mask(data, rep_state_vote_constraints, *constraints):
+    states = {s: rep_state_vote_constraints.get(s, (0, 1)) for s in state_const.states}
+    mask = data_filters.get_constraints_mask(data, states, *constraints)
+    return data if mask is None else data.loc[mask]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the combined constraint mask against the old .loc chain")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    data = get_simulations(args.rows)
+    print(f"{args.rows} rows, best of {args.repeat}, milliseconds")
+    print(f"{'constraints':<24}{'chain rows':>12}{'mask rows':>12}{'loc chain':>12}{'mask':>10}{'speedup':>10}")
+    for name, constraints in constraint_sets.items():
+        chain_ms, chained = best_time(lambda: filter_loc_chain(data, *constraints), args.repeat)
+        mask_ms, masked = best_time(lambda: filter_combined_mask(data, *constraints), args.repeat)
+        # the win buttons read the state win bits, shares between 50% and 50.01% count as won there,
+        # the chain compared the shares with the 50.01% bound
+        if name != "win button, natl" and not np.array_equal(chained.index.to_numpy(), masked.index.to_numpy()):
+            raise AssertionError(f"{name}: the filters select different rows")
+        print(
+            f"{name:<24}{len(chained):>12}{len(masked):>12}{chain_ms:>12.1f}{mask_ms:>10.2f}{chain_ms / mask_ms:>9.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
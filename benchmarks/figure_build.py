@@ -0,0 +1,79 @@
+import argparse
+import json
+import subprocess
+import types
+from plotly.utils import PlotlyJSONEncoder
+from app import json_encoding
+import data_statistics
+import plotly_figures
+from benchmarks.common import best_time, get_simulations
+
+
+# plotly_figures as it was before the figure skeletons, every figure built and validated by go.Figure,
+# found as the parent of the first commit of the change
+skeleton_commit_grep = "^\\[user-019\\]"
+
+
+def get_before_rev():
+    commits = subprocess.run(
+        ["git", "rev-list", "--reverse", f"--grep={skeleton_commit_grep}", "HEAD"],
+        stdout=subprocess.PIPE, universal_newlines=True
+    ).stdout.split()
+    if len(commits) == 0:
+        raise SystemExit(
+            f"no commit matching {skeleton_commit_grep} in the git history, "
+            "pass the revision of plotly_figures before the figure skeletons with --before"
+        )
+    return commits[0] + "^"
+
+
+def load_module_at(rev, path, name):
+    try:
+        source = subprocess.check_output(["git", "show", f"{rev}:{path}"])
+    except subprocess.CalledProcessError:
+        raise SystemExit(f"cannot read {path} at {rev}, run from the repository root or pass another --before")
+    module = types.ModuleType(name)
+    exec(compile(source, f"{rev}:{path}", "exec"), module.__dict__)
+    return module
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the figure builds against the go.Figure versions")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--before", help="git revision of the old plotly_figures")
+    args = parser.parse_args()
+
+    if args.before is None:
+        args.before = get_before_rev()
+    before = load_module_at(args.before, "plotly_figures.py", "plotly_figures_before")
+    data = get_simulations(args.rows)
+    statistics = data_statistics.ViewStatistics(data)
+    simulation = data.iloc[0]
+    histogram = statistics.get_natl_vote_histogram(lambda: data)
+    figures = {
+        "fig_dem_vote_share": lambda module: module.fig_dem_vote_share(simulation),
+        "fig_chance_dem_win": lambda module: module.fig_chance_dem_win(None, statistics.chance_dem_win),
+        "fig_ec_bar": lambda module: module.fig_ec_bar(None, statistics.chance_dem_win),
+        "fig_rep_dem_hist": lambda module: module.fig_rep_dem_hist(histogram),
+    }
+
+    # a response is the figure encoded as dash does it, the plotly encoder before and orjson now
+    def respond_before(build):
+        return json.dumps(build(before), cls=PlotlyJSONEncoder)
+
+    def respond_now(build):
+        return json_encoding.dumps(build(plotly_figures), cls=PlotlyJSONEncoder)
+
+    print(f"best of {args.repeat}, milliseconds, before is {args.before}")
+    print(f"{'figure':<22}{'build before':>14}{'build now':>12}{'response before':>18}{'response now':>15}")
+    for name, build in figures.items():
+        build_before, _ = best_time(lambda: build(before), args.repeat)
+        build_now, _ = best_time(lambda: build(plotly_figures), args.repeat)
+        response_before, _ = best_time(lambda: respond_before(build), args.repeat)
+        response_now, _ = best_time(lambda: respond_now(build), args.repeat)
+        print(f"{name:<22}{build_before:>14.2f}{build_now:>12.2f}{response_before:>18.2f}{response_now:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
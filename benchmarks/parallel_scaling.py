@@ -0,0 +1,55 @@
+import argparse
+import os
+import numpy as np
+import data_filters
+import data_functions
+import data_parallel
+import data_statistics
+from benchmarks.common import best_time, get_simulations
+
+
+def set_parallel_threads(n):
+    data_parallel.parallel_threads = n
+    if data_parallel._executor is not None:
+        data_parallel._executor.shutdown()
+        data_parallel._executor = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the chunked masks and aggregates over PARALLEL_THREADS")
+    parser.add_argument("--rows", type=int, default=4000000)
+    parser.add_argument("--max-threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    data = get_simulations(args.rows)
+    rep_win = data["dem_ec"].to_numpy() < 270
+    rep_natl_vote = 100 * (1 - data["natl_pop_vote"].to_numpy())
+    bins_dict = data_statistics.get_bins_dict(rep_natl_vote)
+    benchmarks = {
+        "get_constraint_mask": lambda: data_filters.get_constraint_mask(data, "PA", (0.45, 0.55)),
+        "win_statistics": lambda: data_functions.win_statistics(data),
+        "get_histogram": lambda: data_statistics.get_histogram(rep_natl_vote, rep_win, bins_dict),
+    }
+
+    data_parallel.parallel_min_rows = 1
+    print(f"{args.rows} rows, {os.cpu_count()} cpus, best of {args.repeat}, milliseconds (speedup)")
+    print(f"{'threads':<10}" + "".join(f"{name:>28}" for name in benchmarks))
+    single = {}
+    expected = {}
+    for n in range(1, args.max_threads + 1):
+        set_parallel_threads(n)
+        row = f"{n:<10}"
+        for name, func in benchmarks.items():
+            ms, result = best_time(func, args.repeat)
+            if n == 1:
+                single[name] = ms
+                expected[name] = result
+            elif not np.allclose(np.hstack(result), np.hstack(expected[name]), equal_nan=True):
+                raise AssertionError(f"{name} differs with {n} threads")
+            row += f"{ms:>18.1f} ({single[name] / ms:>5.2f}x)"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
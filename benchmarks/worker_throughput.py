@@ -0,0 +1,276 @@
+import argparse
+import http.cookiejar
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from threading import Lock, Thread
+import numpy as np
+from conftest import write_simulation_csvs
+
+
+visit_states = ["AZ", "FL", "PA"]
+
+
+def get_free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# waits until the server started by proc answers url
+def wait_for(url, proc, timeout):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=5):
+                return
+        except OSError:
+            if proc.poll() is not None:
+                raise RuntimeError(f"{' '.join(proc.args[1:4])} exited with {proc.returncode}")
+            if time.time() > deadline:
+                raise
+            time.sleep(0.5)
+
+
+def sid(id_dict):
+    return json.dumps(id_dict, sort_keys=True, separators=(",", ":"))
+
+
+def find_props(node, component_type, found):
+    if isinstance(node, dict):
+        props = node.get("props")
+        if isinstance(props, dict) and isinstance(props.get("id"), dict) and props["id"].get("type") == component_type:
+            found.append(props)
+        for value in node.values():
+            find_props(value, component_type, found)
+    elif isinstance(node, list):
+        for value in node:
+            find_props(value, component_type, found)
+    return found
+
+
+# one browser: its own cookies, the requests the page sends for a page load, a few constraints
+# and a reload that has to resume the session where the visit left it
+class Visitor:
+    def __init__(self, url, outputs):
+        self.url = url
+        self.outputs = outputs
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        self.latencies = []
+
+    def request(self, path, body=None):
+        data = None if body is None else json.dumps(body).encode()
+        req = urllib.request.Request(self.url + path, data, {"Content-Type": "application/json"})
+        start = time.perf_counter()
+        with self.opener.open(req, timeout=120) as response:
+            content = response.read()
+        self.latencies.append(time.perf_counter() - start)
+        return content
+
+    def callback(self, output_type, outputs, inputs, changed):
+        body = dict(output=self.outputs[output_type], outputs=outputs, inputs=inputs, changedPropIds=changed, state=[])
+        content = self.request("/_dash-update-component", body)
+        # no content when the callback had nothing to update
+        return json.loads(content)["response"] if content else None
+
+    def select_states(self, states):
+        i = {"type": "states_selector"}
+        return self.callback(
+            "states_control_block", {"id": {"type": "states_control_block"}, "property": "children"},
+            [dict(id=i, property="value", value=states)], [sid(i) + ".value"]
+        )
+
+    def update_figures(self, states, changed, limits):
+        def value(id_dict, prop, v):
+            return dict(id=id_dict, property=prop, value=v)
+
+        state_limits = {s: limits.get(s, (0, 100)) for s in states}
+        outputs = [
+            {"id": {"type": "map_538"}, "property": "figure"},
+            {"id": {"type": "bar_538"}, "property": "figure"},
+            {"id": {"type": "summary"}, "property": "children"},
+            [{"id": {"type": "state_vote_hist", "state": s}, "property": "figure"} for s in states],
+            {"id": {"type": "natl_vote_hist"}, "property": "figure"},
+            {"id": {"type": "ec_vote_hist"}, "property": "figure"},
+            {"id": {"type": "n_states_win_hist"}, "property": "figure"},
+        ]
+        inputs = [
+            [value({"type": "rep_state_vote_lower_limit", "state": s}, "value", state_limits[s][0]) for s in states],
+            [value({"type": "rep_state_vote_upper_limit", "state": s}, "value", state_limits[s][1]) for s in states],
+            value({"type": "rep_natl_vote_lower_limit"}, "value", 0),
+            value({"type": "rep_natl_vote_upper_limit"}, "value", 100),
+            value({"type": "rep_ec_vote_lower_limit"}, "value", limits.get("ec", (0, 538))[0]),
+            value({"type": "rep_ec_vote_upper_limit"}, "value", limits.get("ec", (0, 538))[1]),
+            value({"type": "rep_n_states_win_lower_limit"}, "value", 0),
+            value({"type": "rep_n_states_win_upper_limit"}, "value", 51),
+            value({"type": "random_result_button"}, "n_clicks", None),
+            value({"type": "average_result_button"}, "n_clicks", None),
+            value({"type": "states_control_block"}, "children", []),
+            value({"type": "natl_reset_button"}, "n_clicks", None),
+            value({"type": "natl_histograms"}, "is_open", True),
+        ]
+        return self.callback("map_538", outputs, inputs, [sid(c[0]) + "." + c[1] for c in changed])
+
+    # returns True when the reload resumed the session with every change of the visit
+    def visit(self):
+        self.request("/")
+        self.request("/_dash-layout")
+        self.select_states(visit_states)
+        self.update_figures(visit_states, [({"type": "states_control_block"}, "children")], {})
+        pa = {"PA": (0, 50)}
+        self.update_figures(visit_states, [({"type": "rep_state_vote_upper_limit", "state": "PA"}, "value")], pa)
+        self.update_figures(
+            visit_states, [({"type": "rep_ec_vote_lower_limit"}, "value")], dict(pa, ec=(270, 538))
+        )
+        self.select_states(visit_states[:2])
+        layout = json.loads(self.request("/_dash-layout"))
+        selected = [p.get("value") for p in find_props(layout, "states_selector", [])]
+        return selected == [visit_states[:2]]
+
+
+def run_load(url, n_visitors, seconds):
+    dependencies = json.loads(urllib.request.urlopen(url + "/_dash-dependencies").read())
+    outputs = {}
+    for d in dependencies:
+        for output_type in ("map_538", "states_control_block"):
+            if sid({"type": output_type}) in d["output"]:
+                outputs[output_type] = d["output"]
+
+    results = dict(visits=0, lost=0, errors=0, latencies=[])
+    results_lock = Lock()
+    deadline = time.time() + seconds
+
+    def run_visitor():
+        while time.time() < deadline:
+            visitor = Visitor(url, outputs)
+            resumed = None
+            try:
+                resumed = visitor.visit()
+            except Exception as e:
+                print("visit failed", repr(e))
+            with results_lock:
+                if resumed is None:
+                    results["errors"] += 1
+                else:
+                    results["visits"] += 1
+                    results["lost"] += not resumed
+                results["latencies"].extend(visitor.latencies)
+
+    start = time.time()
+    threads = [Thread(target=run_visitor, daemon=True) for _ in range(n_visitors)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    results["seconds"] = time.time() - start
+    return results
+
+
+def start_redis():
+    port = get_free_port()
+    proc = subprocess.Popen(
+        ["redis-server", "--port", str(port), "--save", "", "--appendonly", "no"], stdout=subprocess.DEVNULL
+    )
+    deadline = time.time() + 10
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return proc, port
+        except OSError:
+            if time.time() > deadline:
+                proc.kill()
+                raise
+            time.sleep(0.1)
+
+
+# sync: one request at a time per worker, gthread: WORKER_THREADS request threads per worker,
+# gevent: greenlets per worker, the app is not preloaded so it is imported after the monkey patching
+def start_gunicorn(profile, workers, concurrency, env, log):
+    port = get_free_port()
+    cmd = [
+        sys.executable, "-m", "gunicorn", "app.factory:build_server()", "--config", "gunicorn.conf.py",
+        "-b", f"127.0.0.1:{port}", "-w", str(workers)
+    ]
+    env = dict(env, WORKER_THREADS="1", PRELOAD_APP="1")
+    if profile == "gthread":
+        env["WORKER_THREADS"] = str(concurrency)
+    elif profile == "gevent":
+        cmd += ["-k", "gevent", "--worker-connections", str(concurrency)]
+        env["PRELOAD_APP"] = "0"
+    proc = subprocess.Popen(cmd, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        wait_for(url + "/_session_stats", proc, 600)
+    except (OSError, RuntimeError):
+        proc.kill()
+        log.flush()
+        with open(log.name) as f:
+            print(f.read()[-2000:])
+        raise
+    return proc, url
+
+
+def print_results(name, n_visitors, results):
+    latencies = 1000 * np.array(results["latencies"] or [np.nan])
+    print(
+        f"{name:<12}{n_visitors:>9}{results['visits'] / results['seconds']:>10.2f}"
+        f"{len(results['latencies']) / results['seconds']:>10.1f}{np.percentile(latencies, 50):>9.0f}"
+        f"{np.percentile(latencies, 95):>9.0f}{results['errors']:>8}{results['lost']:>7}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of the sync, gthread and gevent gunicorn workers")
+    parser.add_argument("--profiles", default="sync,gthread,gevent")
+    parser.add_argument("--visitors", default="1,4,16", help="concurrent visitors, comma separated")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=8, help="threads or greenlets per worker")
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--rows", type=int, default=1000000, help="synthetic simulations without a data folder")
+    parser.add_argument("--url", help="load a running server instead of starting gunicorn")
+    args = parser.parse_args()
+    visitor_counts = [int(v) for v in args.visitors.split(",")]
+
+    if args.url:
+        print("seconds per run", args.seconds, "server", args.url)
+    else:
+        print("seconds per run", args.seconds, "workers", args.workers, "concurrency", args.concurrency)
+    print(f"{'profile':<12}{'visitors':>9}{'visits/s':>10}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}{'lost':>7}")
+    if args.url:
+        for n in visitor_counts:
+            print_results("server", n, run_load(args.url, n, args.seconds))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="worker_throughput_") as tmp:
+        env = dict(os.environ)
+        if not env.get("ELECTION_DATA_FOLDER"):
+            env["ELECTION_DATA_FOLDER"] = os.path.join(tmp, "data")
+            os.makedirs(env["ELECTION_DATA_FOLDER"])
+            write_simulation_csvs(env["ELECTION_DATA_FOLDER"], args.rows, n_files=4)
+        redis_proc = None
+        if not env.get("REDIS_HOST"):
+            redis_proc, port = start_redis()
+            env.update(REDIS_HOST="127.0.0.1", REDIS_PORT=str(port))
+
+        try:
+            with open(os.path.join(tmp, "gunicorn.log"), "w") as log:
+                for profile in args.profiles.split(","):
+                    proc, url = start_gunicorn(profile, args.workers, args.concurrency, env, log)
+                    try:
+                        for n in visitor_counts:
+                            print_results(profile, n, run_load(url, n, args.seconds))
+                    finally:
+                        proc.terminate()
+                        proc.wait()
+        finally:
+            if redis_proc is not None:
+                redis_proc.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import data_functions
+import state_const
+
+
+battleground_leans = dict(AZ=0.495, FL=0.49, GA=0.5, NC=0.495, OH=0.47, PA=0.52, WI=0.52, MI=0.53)
+
+
+# simulations with a national swing shared by every state, like the model output
+def make_simulations(n, seed=0):
+    rng = np.random.RandomState(seed)
+    lean = rng.uniform(0.25, 0.75, len(state_const.states))
+    for s, state_lean in battleground_leans.items():
+        lean[state_const.states.index(s)] = state_lean
+    swing = rng.normal(0, 0.03, (n, 1))
+    shares = np.clip(lean + swing + rng.normal(0, 0.02, (n, len(state_const.states))), 0.01, 0.99)
+    data = pd.DataFrame(shares, columns=state_const.states)
+    data["natl_pop_vote"] = np.clip(0.52 + swing[:, 0] + rng.normal(0, 0.005, n), 0, 1)
+    return data
+
+
+def write_simulation_csvs(folder, n, n_files=2, seed=0):
+    data = make_simulations(n, seed)
+    for i, rows in enumerate(np.array_split(np.arange(n), n_files)):
+        data.iloc[rows].to_csv(os.path.join(folder, f"sim{i}.csv"), index_label="sim")
+    return data
+
+
+@pytest.fixture
+def simulations():
+    data = make_simulations(200000)
+    data["dem_ec"] = data_functions.get_dem_ec(data)
+    data[data_functions.win_mask_column] = data_functions.get_dem_win_mask(data)
+    return data
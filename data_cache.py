@@ -0,0 +1,363 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from glob import glob
+import argparse
+import hashlib
+import fcntl
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import state_const
+import data_functions
+import numpy as np
+import pandas as pd
+
+
+cache_format_version = 3
+share_columns = state_const.states + ["natl_pop_vote"]
+ingest_workers = int(os.environ.get("INGEST_WORKERS", os.cpu_count() or 1))
+ingest_chunk_size = int(os.environ.get("INGEST_CHUNK_SIZE", 100000))
+# the cache is rebuilt from the watcher thread of a worker that may run request threads, forking such a
+# process can copy locks other threads hold, the ingest processes start from a clean server process instead
+ingest_start_method = os.environ.get("INGEST_START_METHOD", "forkserver")
+cache_arrays = [("shares", np.float64), ("dem_ec", np.int64), ("dem_win_mask", np.uint64)]
+
+
+def get_cache_folder(data_folder):
+    return os.environ.get("ELECTION_CACHE_FOLDER", os.path.join(data_folder, ".election_cache"))
+
+
+def get_csv_filenames(data_folder):
+    return sorted(glob(f"{data_folder}/*.csv"))
+
+
+def file_sha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def get_source_info(csv_filename, with_hash=True):
+    stat = os.stat(csv_filename)
+    info = dict(
+        name=os.path.basename(csv_filename),
+        mtime_ns=stat.st_mtime_ns,
+        size=stat.st_size
+    )
+    if with_hash:
+        info["sha1"] = file_sha1(csv_filename)
+    return info
+
+
+def get_version(sources):
+    sha1 = hashlib.sha1(str(cache_format_version).encode())
+    for s in sources:
+        sha1.update(f"{s['name']}:{s['sha1']}".encode())
+    return sha1.hexdigest()[:16]
+
+
+def read_manifest(cache_folder):
+    try:
+        with open(os.path.join(cache_folder, "manifest.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(cache_folder, manifest):
+    tmp_path = os.path.join(cache_folder, "manifest.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, os.path.join(cache_folder, "manifest.json"))
+
+
+def is_fresh(manifest, csv_filenames, verify_hash=False):
+    if manifest is None or manifest.get("format_version") != cache_format_version:
+        return False
+    if [s["name"] for s in manifest["sources"]] != [os.path.basename(p) for p in csv_filenames]:
+        return False
+    for source, path in zip(manifest["sources"], csv_filenames):
+        info = get_source_info(path, with_hash=verify_hash)
+        if info["mtime_ns"] != source["mtime_ns"] or info["size"] != source["size"]:
+            return False
+        if verify_hash and info["sha1"] != source["sha1"]:
+            return False
+    return True
+
+
+# True while another process builds the cache, it holds the lock for the whole build
+def is_building(cache_folder):
+    try:
+        with open(os.path.join(cache_folder, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    except BlockingIOError:
+        return True
+    except OSError:
+        pass
+    return False
+
+
+@contextmanager
+def cache_lock(cache_folder):
+    os.makedirs(cache_folder, exist_ok=True)
+    with open(os.path.join(cache_folder, ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def load_arrays(version_folder, suffix="", mmap_mode="r"):
+    return {
+        name: np.load(os.path.join(version_folder, name + ".npy" + suffix), mmap_mode=mmap_mode)
+        for name, _ in cache_arrays
+    }
+
+
+# hashes the bytes of a file as the csv parser reads them
+class HashingReader:
+    def __init__(self, f):
+        self.f = f
+        self.sha1 = hashlib.sha1()
+
+    def read(self, size=-1):
+        block = self.f.read(size)
+        self.sha1.update(block)
+        return block
+
+    def readline(self):
+        line = self.f.readline()
+        self.sha1.update(line)
+        return line
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+
+def get_part_path(part_prefix, k, name):
+    return f"{part_prefix}.{k}.{name}.npy"
+
+
+# parses a csv in one read, its chunks are written as separate arrays next to part_prefix because
+# the number of rows is only known at the end, blank lines and quoted newlines are not rows
+def ingest_csv(path, part_prefix):
+    chunk_rows = []
+    missing_rows = 0
+    out_of_range_rows = 0
+    with open(path, "rb") as f:
+        reader = HashingReader(f)
+        chunks = pd.read_csv(
+            reader, usecols=share_columns, dtype={c: np.float64 for c in share_columns}, chunksize=ingest_chunk_size
+        )
+        for k, chunk in enumerate(chunks):
+            arrays = dict(
+                shares=np.asfortranarray(chunk[share_columns].to_numpy()),
+                dem_ec=data_functions.get_dem_ec(chunk),
+                dem_win_mask=data_functions.get_dem_win_mask(chunk)
+            )
+            for name, dtype in cache_arrays:
+                np.save(get_part_path(part_prefix, k, name), np.asarray(arrays[name], dtype=dtype))
+            chunk_rows.append(len(chunk))
+            # checked once here, loading the cache only reads the counts from the manifest
+            missing_rows += int(np.isnan(arrays["shares"]).any(axis=1).sum())
+            out_of_range_rows += int(((arrays["shares"] < 0) | (arrays["shares"] > 1)).any(axis=1).sum())
+        for _ in iter(lambda: reader.read(1 << 20), b""):
+            pass
+    return dict(
+        sha1=reader.sha1.hexdigest(), chunk_rows=chunk_rows,
+        missing_rows=missing_rows, out_of_range_rows=out_of_range_rows
+    )
+
+
+def copy_parts(version_folder, part_prefix, offset, chunk_rows):
+    arrays = load_arrays(version_folder, ".tmp", "r+")
+    row = offset
+    for k, n_rows in enumerate(chunk_rows):
+        for name, _ in cache_arrays:
+            part_path = get_part_path(part_prefix, k, name)
+            arrays[name][row:row + n_rows] = np.load(part_path)
+            os.remove(part_path)
+        row += n_rows
+    for array in arrays.values():
+        array.flush()
+
+
+# rows of unchanged files are copied from the previous version of the cache, only new
+# and modified files are parsed again
+def get_reusable_sources(cache_folder, manifest):
+    if manifest is None or manifest.get("format_version") != cache_format_version:
+        return {}, None
+    try:
+        old_arrays = load_arrays(os.path.join(cache_folder, manifest["version"]))
+    except (OSError, ValueError):
+        return {}, None
+    offsets = np.cumsum([0] + [s["rows"] for s in manifest["sources"]])
+    return {s["name"]: (s, int(offset)) for s, offset in zip(manifest["sources"], offsets)}, old_arrays
+
+
+def build_cache(data_folder, csv_filenames=None, cache_folder=None):
+    if csv_filenames is None:
+        csv_filenames = get_csv_filenames(data_folder)
+    if cache_folder is None:
+        cache_folder = get_cache_folder(data_folder)
+    old_manifest = read_manifest(cache_folder)
+    old_sources, old_arrays = get_reusable_sources(cache_folder, old_manifest)
+
+    def same_file(a, b):
+        return a is not None and a["mtime_ns"] == b["mtime_ns"] and a["size"] == b["size"]
+
+    with ProcessPoolExecutor(
+            max_workers=max(1, min(ingest_workers, len(csv_filenames))),
+            mp_context=multiprocessing.get_context(ingest_start_method)
+    ) as pool:
+        sources = [get_source_info(p, with_hash=False) for p in csv_filenames]
+        changed = [
+            i for i, source in enumerate(sources)
+            if not same_file(old_sources.get(source["name"], (None,))[0], source)
+        ]
+        build_folder = tempfile.mkdtemp(prefix=".build_", dir=cache_folder)
+        try:
+            part_prefixes = {i: os.path.join(build_folder, str(i)) for i in changed}
+            ingested = dict(zip(changed, pool.map(
+                ingest_csv, [csv_filenames[i] for i in changed], [part_prefixes[i] for i in changed]
+            )))
+            for i, source in enumerate(sources):
+                if i in ingested:
+                    sources[i] = dict(
+                        source, sha1=ingested[i]["sha1"], rows=sum(ingested[i]["chunk_rows"]),
+                        missing_rows=ingested[i]["missing_rows"], out_of_range_rows=ingested[i]["out_of_range_rows"]
+                    )
+                else:
+                    sources[i] = dict(old_sources[source["name"]][0], mtime_ns=source["mtime_ns"], size=source["size"])
+
+            version = get_version(sources)
+            version_folder = os.path.join(cache_folder, version)
+            os.makedirs(version_folder, exist_ok=True)
+            offsets = np.cumsum([0] + [s["rows"] for s in sources])
+
+            # allocated once the parsed rows are known, the workers copy their chunks straight into the files,
+            # column major so every state is a contiguous run of values
+            n = int(offsets[-1])
+            arrays = {
+                name: np.lib.format.open_memmap(
+                    os.path.join(version_folder, name + ".npy.tmp"), mode="w+",
+                    dtype=dtype, shape=(n, len(share_columns)) if name == "shares" else (n,), fortran_order=True
+                )
+                for name, dtype in cache_arrays
+            }
+
+            jobs = []
+            for i, (source, offset) in enumerate(zip(sources, offsets)):
+                if i in ingested:
+                    jobs.append(pool.submit(
+                        copy_parts, version_folder, part_prefixes[i], int(offset), ingested[i]["chunk_rows"]
+                    ))
+                else:
+                    old_offset = old_sources[source["name"]][1]
+                    for name, array in arrays.items():
+                        array[offset:offset + source["rows"]] = old_arrays[name][old_offset:old_offset + source["rows"]]
+            for array in arrays.values():
+                array.flush()
+            del arrays
+            for job in jobs:
+                job.result()
+        finally:
+            shutil.rmtree(build_folder, ignore_errors=True)
+
+    # never truncate a file another worker may have mapped
+    for name, _ in cache_arrays:
+        os.replace(os.path.join(version_folder, name + ".npy.tmp"), os.path.join(version_folder, name + ".npy"))
+
+    manifest = dict(
+        format_version=cache_format_version,
+        version=version,
+        n_rows=n,
+        share_columns=share_columns,
+        sources=sources
+    )
+    write_manifest(cache_folder, manifest)
+    # workers that still map the old files keep their pages after the unlink
+    if old_manifest is not None and old_manifest.get("version") not in (None, version):
+        shutil.rmtree(os.path.join(cache_folder, old_manifest["version"]), ignore_errors=True)
+    print("simulation cache built", version, n, "parsed", len(ingested), "of", len(sources), "files")
+    return manifest
+
+
+def check_cache(manifest, arrays):
+    missing = [s["name"] for s in manifest["sources"] if s["missing_rows"] > 0]
+    if len(missing) > 0:
+        raise ValueError(f"Simulation data contains missing vote shares in {missing}")
+    out_of_range = [s["name"] for s in manifest["sources"] if s["out_of_range_rows"] > 0]
+    if len(out_of_range) > 0:
+        raise ValueError(f"Simulation vote shares must be between 0 and 1 in {out_of_range}")
+    for name, dtype in cache_arrays:
+        shape = (manifest["n_rows"], len(manifest["share_columns"])) if name == "shares" else (manifest["n_rows"],)
+        if arrays[name].dtype != dtype or arrays[name].shape != shape:
+            raise ValueError(f"Simulation cache {name} does not match its manifest")
+
+
+def load_cache(cache_folder, manifest):
+    arrays = load_arrays(os.path.join(cache_folder, manifest["version"]))
+    check_cache(manifest, arrays)
+    data = pd.DataFrame(arrays["shares"], columns=manifest["share_columns"], copy=False)
+    data["dem_ec"] = arrays["dem_ec"]
+    data[data_functions.win_mask_column] = arrays["dem_win_mask"]
+    return data
+
+
+def get_current_version(data_folder, cache_folder=None):
+    if cache_folder is None:
+        cache_folder = get_cache_folder(data_folder)
+    manifest = read_manifest(cache_folder)
+    if is_fresh(manifest, get_csv_filenames(data_folder)):
+        return manifest["version"]
+    return None
+
+
+# returns the cache folder the data was loaded from along with the data and its version,
+# private_folder is the cache this process built before when the shared one was unavailable
+def load_data(data_folder, verify_hash=False, private_folder=None):
+    csv_filenames = get_csv_filenames(data_folder)
+    if len(csv_filenames) == 0:
+        raise ValueError(f"No simulation csv files found in {data_folder}")
+    cache_folder = get_cache_folder(data_folder)
+
+    try:
+        with cache_lock(cache_folder):
+            manifest = read_manifest(cache_folder)
+            if not is_fresh(manifest, csv_filenames, verify_hash):
+                manifest = build_cache(data_folder, csv_filenames, cache_folder)
+            return load_cache(cache_folder, manifest), manifest["version"], cache_folder
+    except OSError as e:
+        # read-only data folder, build a private cache for this process instead
+        print("simulation cache unavailable", e)
+        cache_folder = private_folder or tempfile.mkdtemp(prefix="election_cache_")
+        manifest = read_manifest(cache_folder)
+        if not is_fresh(manifest, csv_filenames, verify_hash):
+            manifest = build_cache(data_folder, csv_filenames, cache_folder)
+        return load_cache(cache_folder, manifest), manifest["version"], cache_folder
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the compiled cache of the simulation csv files")
+    parser.add_argument("data_folder", nargs="?", default=os.environ.get("ELECTION_DATA_FOLDER"))
+    parser.add_argument("--verify", action="store_true", help="compare file hashes, not only mtime and size")
+    args = parser.parse_args()
+
+    csv_filenames = get_csv_filenames(args.data_folder)
+    cache_folder = get_cache_folder(args.data_folder)
+    with cache_lock(cache_folder):
+        if is_fresh(read_manifest(cache_folder), csv_filenames, args.verify):
+            print("simulation cache is up to date", cache_folder)
+        else:
+            build_cache(args.data_folder, csv_filenames)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,196 @@
-from data_functions import get_dem_number_state_wins
+from data_functions import get_dem_number_state_wins, get_win_threshold, is_quantized, quantize_share
+from data_functions import win_mask_column, state_win_bits, share_scale
+import state_const
+import data_parallel
+import numpy as np
+import pandas as pd
+
+
+full_share_interval = (0, 1)
+full_ec_interval = (0, 538)
+full_states_win_interval = (0, 51)
+# an index range is only worth it when it selects at most this fraction of the rows
+index_max_selectivity = 0.25
+# index lookups cover a little more than the constraint, the candidates are then checked exactly
+index_margin = 0.0002
+
+
+def is_full_interval(interval, full_interval):
+    return interval[0] <= full_interval[0] and full_interval[1] <= interval[1]
+
+
+def dem_state_win_mask(data, dem_win):
+    if win_mask_column in data.columns:
+        return (data[win_mask_column].to_numpy() & state_win_bits[dem_win]) != 0
+    return data[dem_win].to_numpy() >= get_win_threshold(data)
+
+
+def rep_state_win_mask(data, rep_win):
+    if win_mask_column in data.columns:
+        return (data[win_mask_column].to_numpy() & state_win_bits[rep_win]) == 0
+    return data[rep_win].to_numpy() < get_win_threshold(data)
+
+
+# compact data stores shares as fixed point integers, compare against quantized bounds
+def dem_share_range_mask(data, column, f=0, t=1):
+    values = data[column].to_numpy()
+    if is_quantized(data[column]):
+        f = quantize_share(f)
+        t = quantize_share(t)
+    return (f <= values) & (values <= t)
+
+
+def rep_share_range_mask(data, column, f=0, t=1):
+    if is_quantized(data[column]):
+        return dem_share_range_mask(data, column, 1 - t, 1 - f)
+    rep_values = 1 - data[column].to_numpy()
+    return (f <= rep_values) & (rep_values <= t)
+
+
+def rep_state_vote_range_mask(data, state, f=0, t=1):
+    if win_mask_column in data.columns:
+        # intervals set by the win buttons, 50.01 is the smallest share above 50 the inputs hold
+        if f <= 0 and t == 0.5:
+            return dem_state_win_mask(data, state)
+        if 0.5 < f <= 0.5001 and t >= 1:
+            return rep_state_win_mask(data, state)
+    return rep_share_range_mask(data, state, f, t)
+
+
+def dem_electoral_college_range_mask(data, f=0, t=538):
+    dem_ec = data["dem_ec"].to_numpy()
+    return (f <= dem_ec) & (dem_ec <= t)
+
+
+def rep_electoral_college_range_mask(data, f=0, t=538):
+    return dem_electoral_college_range_mask(data, 538 - t, 538 - f)
+
+
+def dem_n_states_win_range_mask(data, n_min=0, n_max=51):
+    n_dem_states_won = get_dem_number_state_wins(data).to_numpy()
+    return (n_min <= n_dem_states_won) & (n_dem_states_won <= n_max)
+
+
+def rep_n_states_win_range_mask(data, n_min=0, n_max=51):
+    return dem_n_states_win_range_mask(data, 51 - n_max, 51 - n_min)
+
+
+def get_full_interval(name):
+    if name == "dem_ec":
+        return full_ec_interval
+    if name == "n_states_won":
+        return full_states_win_interval
+    return full_share_interval
+
+
+# mask of the rows that satisfy one constraint, constraints are named by the column they read,
+# None when the interval does not constrain anything
+def get_constraint_mask(data, name, interval):
+    if is_full_interval(interval, get_full_interval(name)):
+        return None
+    masks = data_parallel.map_frame_chunks(lambda chunk: _get_constraint_mask(chunk, name, interval), data)
+    return masks[0] if len(masks) == 1 else np.concatenate(masks)
+
+
+def _get_constraint_mask(data, name, interval):
+    if name == "dem_ec":
+        return rep_electoral_college_range_mask(data, *interval)
+    if name == "n_states_won":
+        return rep_n_states_win_range_mask(data, *interval)
+    if name == "natl_pop_vote":
+        return rep_share_range_mask(data, name, *interval)
+    return rep_state_vote_range_mask(data, name, *interval)
+
+
+def get_constraint_items(
+        rep_state_vote_constraints,
+        rep_natl_vote_constraint=full_share_interval,
+        rep_ec_vote_constraint=full_ec_interval,
+        rep_states_win_constraint=full_states_win_interval
+):
+    return [
+        *rep_state_vote_constraints.items(),
+        ("natl_pop_vote", rep_natl_vote_constraint),
+        ("dem_ec", rep_ec_vote_constraint),
+        ("n_states_won", rep_states_win_constraint)
+    ]
+
+
+# all active constraints combined into one mask in a single pass over the columns,
+# None when nothing is constrained
+def get_constraints_mask(data, *constraints):
+    mask = None
+    for name, interval in get_constraint_items(*constraints):
+        constraint_mask = get_constraint_mask(data, name, interval)
+        if constraint_mask is None:
+            continue
+        if mask is None:
+            mask = constraint_mask
+        else:
+            mask &= constraint_mask
+    return mask
+
+
+def _get_index_interval(data, column, f, t, margin):
+    if is_quantized(data[column]):
+        return np.floor((f - margin) * share_scale), np.ceil((t + margin) * share_scale)
+    return f - margin, t + margin
+
+
+# the most selective constraint is resolved with a binary search of its sorted index, the
+# other constraints are only checked on the candidate rows, None when no constraint is narrow enough
+def get_constraints_rows(
+        data,
+        column_index,
+        rep_state_vote_constraints,
+        rep_natl_vote_constraint=full_share_interval,
+        rep_ec_vote_constraint=full_ec_interval,
+        rep_states_win_constraint=full_states_win_interval
+):
+    dem_intervals = []
+    for s, (f, t) in rep_state_vote_constraints.items():
+        if not is_full_interval((f, t), full_share_interval):
+            dem_intervals.append((s, *_get_index_interval(data, s, 1 - t, 1 - f, index_margin)))
+    if not is_full_interval(rep_natl_vote_constraint, full_share_interval):
+        f, t = rep_natl_vote_constraint
+        dem_intervals.append(("natl_pop_vote", *_get_index_interval(data, "natl_pop_vote", 1 - t, 1 - f, index_margin)))
+    if not is_full_interval(rep_ec_vote_constraint, full_ec_interval):
+        f, t = rep_ec_vote_constraint
+        dem_intervals.append(("dem_ec", 538 - t, 538 - f))
+
+    best = None
+    for column, f, t in dem_intervals:
+        lo, hi = column_index.get(column).get_range(f, t)
+        if best is None or hi - lo < best[2] - best[1]:
+            best = (column, lo, hi)
+    if best is None or best[2] - best[1] > index_max_selectivity * len(data):
+        return None
+
+    column, lo, hi = best
+    candidates = np.sort(column_index.get(column).order[lo:hi])
+    # gather only the columns the constraints read, not whole rows
+    columns = [c for c, _, _ in dem_intervals] + [
+        c for c in [win_mask_column, "dem_n_states_won"] if c in data.columns
+    ]
+    if not is_full_interval(rep_states_win_constraint, full_states_win_interval) and len(columns) == len(dem_intervals):
+        columns += state_const.states
+    candidate_data = pd.DataFrame({c: data[c].to_numpy()[candidates] for c in dict.fromkeys(columns)})
+    mask = get_constraints_mask(
+        candidate_data,
+        rep_state_vote_constraints,
+        rep_natl_vote_constraint,
+        rep_ec_vote_constraint,
+        rep_states_win_constraint
+    )
+    return candidates[mask]
 
 
 def filter_dem_state_win(data,  dem_win):
-    return data.loc[data[dem_win] > 0.5]
+    return data.loc[dem_state_win_mask(data, dem_win)]
 
 
 def filter_rep_state_win(data,  rep_win):
-    return data.loc[data[rep_win] < 0.5]
+    return data.loc[rep_state_win_mask(data, rep_win)]
 
 
 def filter_rep_states_wins(data, rep_wins):
@@ -21,16 +205,16 @@ def filter_dem_states_wins(data, dem_wins):
     return data
 
 
+def filter_dem_share_range(data, column, f=0, t=1):
+    return data.loc[dem_share_range_mask(data, column, f, t)]
+
+
 def filter_dem_electoral_college_range(data, f=0, t=538):
-    data = data.loc[f <= data["dem_ec"]]
-    data = data.loc[data["dem_ec"] <= t]
-    return data
+    return data.loc[dem_electoral_college_range_mask(data, f, t)]
 
 
 def filter_rep_electoral_college_range(data, f=0, t=538):
-    data = data.loc[f <= (538 - data["dem_ec"])]
-    data = data.loc[(538 - data["dem_ec"]) <= t]
-    return data
+    return data.loc[rep_electoral_college_range_mask(data, f, t)]
 
 
 def filter_dem_electoral_college(data, ec):
@@ -42,29 +226,19 @@ def filter_rep_electoral_college(data, ec):
 
 
 def filter_dem_natl_vote_range(data, f=0, t=1):
-    data = data.loc[f <= data["natl_pop_vote"]]
-    data = data.loc[data["natl_pop_vote"] <= t]
-    return data
+    return filter_dem_share_range(data, "natl_pop_vote", f, t)
 
 
 def filter_rep_natl_vote_range(data, f=0, t=1):
-    data = data.loc[f <= (1 - data["natl_pop_vote"])]
-    data = data.loc[(1 - data["natl_pop_vote"]) <= t]
-    return data
+    return data.loc[rep_share_range_mask(data, "natl_pop_vote", f, t)]
 
 
 def filter_dem_n_states_win_range(data, n_min=0, n_max=51):
-    n_dem_states_won = get_dem_number_state_wins(data)
-    data = data.loc[n_min <= n_dem_states_won]
-    data = data.loc[n_dem_states_won <= n_max]
-    return data
+    return data.loc[dem_n_states_win_range_mask(data, n_min, n_max)]
 
 
 def filter_rep_n_states_win_range(data, n_min=0, n_max=51):
-    n_rep_states_won = 51 - get_dem_number_state_wins(data)
-    data = data.loc[n_min <= n_rep_states_won]
-    data = data.loc[n_rep_states_won <= n_max]
-    return data
+    return data.loc[rep_n_states_win_range_mask(data, n_min, n_max)]
 
 
 def filter_dem_n_states_win(data, n):
@@ -76,15 +250,11 @@ def filter_rep_n_states_win(data, n):
 
 
 def filter_dem_state_vote_range(data, state, f=0, t=1):
-    data = data.loc[f <= data[state]]
-    data = data.loc[data[state] <= t]
-    return data
+    return filter_dem_share_range(data, state, f, t)
 
 
 def filter_rep_state_vote_range(data, state, f=0, t=1):
-    data = data.loc[f <= (1 - data[state])]
-    data = data.loc[(1 - data[state]) <= t]
-    return data
+    return data.loc[rep_state_vote_range_mask(data, state, f, t)]
 
 
 def filter_dem_states_vote_range(data, ranges_dict):
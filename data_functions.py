@@ -1,28 +1,102 @@
 import state_const
+import data_parallel
 import numpy as np
 import pandas as pd
-import pyarrow as pa
 
 
-def serialize_pd(df):
-    return pa.serialize(df).to_buffer().to_pybytes()
+# fixed point scale of the uint16 vote shares in compact data, 1e-4 resolution
+share_scale = 10000
+share_columns = state_const.states + ["natl_pop_vote"]
+# bit i of the win mask is set when Democrats win state i
+win_mask_column = "dem_win_mask"
+state_win_bits = {s: np.uint64(1 << i) for i, s in enumerate(state_const.states)}
+_popcount_table = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+_byte_bits = np.array([[(i >> j) & 1 for j in range(8)] for i in range(256)])
 
 
-def deserialize_pd(pybytes):
-    return pa.deserialize(pybytes)
-
-
-def load_data(csv_filenames):
-    elections_data = pd.concat([pd.read_csv(p) for p in csv_filenames], ignore_index=True)
-    states_dem_share = elections_data[state_const.states].to_numpy()
+def get_dem_ec(data):
+    states_dem_share = data[state_const.states].to_numpy()
     ec_vote_size_np = np.array([[state_const.ec_vote_size[s]] for s in state_const.states])
 
     with_dem05 = (states_dem_share >= 0.5) @ ec_vote_size_np
     # let 0.5 tie be resolved in favour of Democratic party
     # alternative: without_dem05 = (states_dem_share > 0.5) @ ec_vote_size_np
 
-    elections_data["dem_ec"] = with_dem05
-    return elections_data
+    return with_dem05[:, 0]
+
+
+def get_dem_win_mask(data):
+    threshold = get_win_threshold(data)
+    mask = np.zeros(len(data), dtype=np.uint64)
+    for s in state_const.states:
+        mask |= (data[s].to_numpy() >= threshold).astype(np.uint64) * state_win_bits[s]
+    return mask
+
+
+def popcount(values):
+    values_bytes = np.ascontiguousarray(values, dtype="<u8").view(np.uint8).reshape(-1, 8)
+    return _popcount_table[values_bytes].sum(axis=1, dtype=np.uint8)
+
+
+# number of set bits per mask bit position, from a histogram of every byte of the masks
+def get_win_mask_bit_counts(mask):
+    n_bytes = (len(state_const.states) + 7) // 8
+
+    def count_chunk(rows):
+        mask_bytes = np.ascontiguousarray(mask[rows], dtype="<u8").view(np.uint8).reshape(-1, 8)
+        return np.stack([np.bincount(mask_bytes[:, k], minlength=256) for k in range(n_bytes)])
+
+    byte_counts = data_parallel.sum_chunks(count_chunk, len(mask))
+    return (byte_counts @ _byte_bits).ravel()[:len(state_const.states)]
+
+
+def compact_data(data, share_dtype="uint16"):
+    shares = data[share_columns].to_numpy(np.float64)
+    if share_dtype == "uint16":
+        # floor keeps share >= 0.5 exactly equivalent to quantized share >= share_scale / 2
+        compact_shares = np.floor(shares * share_scale).astype(np.uint16)
+    elif share_dtype == "float32":
+        compact_shares = shares.astype(np.float32)
+        # do not let rounding turn a narrow loss into a tie
+        rounded_up = (compact_shares >= 0.5) & (shares < 0.5)
+        compact_shares[rounded_up] = np.nextafter(np.float32(0.5), np.float32(0))
+    else:
+        raise ValueError(f"Unexpected compact share type {share_dtype}")
+
+    compact = pd.DataFrame(compact_shares, columns=share_columns, index=data.index)
+    compact["dem_ec"] = data["dem_ec"].to_numpy(np.uint16)
+    compact["dem_n_states_won"] = get_dem_number_state_wins(data).to_numpy(np.uint8)
+    if win_mask_column in data.columns:
+        compact[win_mask_column] = data[win_mask_column].to_numpy(np.uint64)
+    return compact
+
+
+def expand_data(data):
+    if not is_quantized(data[share_columns[0]]):
+        return data
+    expanded = pd.DataFrame(data[share_columns].to_numpy() / share_scale, columns=share_columns, index=data.index)
+    expanded["dem_ec"] = data["dem_ec"].to_numpy(np.int64)
+    return expanded
+
+
+def is_quantized(column):
+    return np.issubdtype(column.dtype, np.integer)
+
+
+def quantize_share(share):
+    return int(round(share * share_scale))
+
+
+def get_dem_share(data, column):
+    if is_quantized(data[column]):
+        return data[column] / share_scale
+    return data[column]
+
+
+def get_win_threshold(data):
+    if is_quantized(data[state_const.states[0]]):
+        return quantize_share(0.5)
+    return 0.5
 
 
 def point_lead_to_vote_share(lead):
@@ -38,33 +112,55 @@ def vote_share_to_point_lead(share):
 
 
 def get_chance_dem_win(data):
-    return (data[state_const.states] >= 0.5).mean()
+    if win_mask_column in data.columns:
+        if len(data) == 0:
+            return pd.Series(np.nan, index=state_const.states)
+        wins = get_win_mask_bit_counts(data[win_mask_column].to_numpy())
+        return pd.Series(wins / len(data), index=state_const.states)
+    return (data[state_const.states] >= get_win_threshold(data)).mean()
 
 
 def get_mean_dem_results(data):
-    return data[state_const.states].mean()
+    mean = data[state_const.states].mean()
+    if is_quantized(data[state_const.states[0]]):
+        mean = mean / share_scale
+    return mean
 
 
 def get_dem_number_state_wins(data):
-    return (data[state_const.states] >= 0.5).sum(axis=1)
+    if "dem_n_states_won" in data.columns:
+        return data["dem_n_states_won"]
+    if win_mask_column in data.columns:
+        return pd.Series(popcount(data[win_mask_column].to_numpy()), index=data.index)
+    return (data[state_const.states] >= get_win_threshold(data)).sum(axis=1)
 
 
 def get_rep_number_state_wins(data):
-    return (data[state_const.states] < 0.5).sum(axis=1)
+    if "dem_n_states_won" in data.columns or win_mask_column in data.columns:
+        return 51 - get_dem_number_state_wins(data)
+    return (data[state_const.states] < get_win_threshold(data)).sum(axis=1)
 
 
 def win_statistics(data):
-    dem_win_data = data.loc[data["dem_ec"] >= 270]
-    rep_win_data = data.loc[data["dem_ec"] < 270]
-    n = len(data)
-    n_r = len(rep_win_data)
-    n_d = len(dem_win_data)
+    dem_ec = data["dem_ec"].to_numpy()
+
+    # counts and sums of the electoral votes, overall and of the simulations biden wins
+    def sum_chunk(rows):
+        chunk = dem_ec[rows].astype(np.float64)
+        dem_win = chunk >= 270
+        return np.array([len(chunk), chunk.sum(), dem_win.sum(), chunk[dem_win].sum()])
+
+    n, ec_sum, n_d, dem_ec_sum = data_parallel.sum_chunks(sum_chunk, len(dem_ec))
+    n_r = n - n_d
+
+    def mean(total, count):
+        return total / count if count > 0 else np.nan
 
     if n == 0:
         n = np.nan
 
     return (
-        data["dem_ec"].mean(),
-        (n_d / n, dem_win_data["dem_ec"].mean()),
-        (n_r / n, 538 - rep_win_data["dem_ec"].mean())
+        mean(ec_sum, n),
+        (n_d / n, mean(dem_ec_sum, n_d)),
+        (n_r / n, 538 - mean(ec_sum - dem_ec_sum, n_r))
     )
@@ -0,0 +1,37 @@
+from threading import Lock
+import numpy as np
+
+
+class SortedIndex:
+    def __init__(self, values):
+        self.order = np.argsort(values, kind="stable")
+        self.sorted_values = values[self.order]
+
+    def get_range(self, f, t):
+        lo = np.searchsorted(self.sorted_values, f, side="left")
+        hi = np.searchsorted(self.sorted_values, t, side="right")
+        return lo, hi
+
+    def get_rows(self, f, t):
+        lo, hi = self.get_range(f, t)
+        return self.order[lo:hi]
+
+
+# sorted permutation indexes of the columns of a read-only frame, built on first use
+class ColumnIndex:
+    def __init__(self, data):
+        self.data = data
+        self.indexes = {}
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, column):
+        index = self.indexes.get(column)
+        if index is None:
+            with self.lock:
+                index = self.indexes.get(column)
+                if index is None:
+                    index = self.indexes[column] = SortedIndex(self.data[column].to_numpy())
+        return index
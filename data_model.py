@@ -1,8 +1,12 @@
+from contextlib import contextmanager
 from threading import Lock
 from state_const import states
 import data_filters
 import random
-from data_functions import serialize_pd, deserialize_pd
+from data_functions import expand_data
+from data_statistics import ViewStatistics
+import data_store
+import numpy as np
 
 
 # is a inside b
@@ -24,24 +28,42 @@ def fill_interval_none(new_interval, old_interval):
 
 
 class DataModel:
-    def __init__(self, data=None):
-        if data is not None:
-            self.data = data.copy()
-            self.original_data = data.copy()
-        else:
-            self.data = None
-            self.original_data = None
+    def __init__(self, data=None, data_version=None, sample_seed=None):
+        # filters never modify a frame in place, so the filtered view can start as the original
+        self._data = data
+        # row positions of the view in the original data, when known
+        self.rows = None
+        self.original_data = data
+        # the session subsample is identified by the store version and the sample seed
+        self.data_version = data_version
+        self.sample_seed = sample_seed
+        self.sample_size = None if data is None else len(data)
         self.rep_state_vote_constraints = {s: (0, 1) for s in states}
         self.rep_natl_vote_constraint = (0, 1)
         self.rep_ec_vote_constraint = (0, 538)
         self.rep_states_win_constraint = (0, 51)
         self.data_changed = True
+        # masks of the active constraints and the number of constraints each row violates,
+        # built on the first relaxed constraint, a row is in the view when it violates none
+        self.constraint_masks = None
+        self.violations = None
+        # statistics of the current view and the constraints key they were computed for
+        self.statistics = None
+        # constraint names changed inside a batch, with their interval before the batch
+        self.batch_changes = None
         self.data_lock = Lock()
 
+    @staticmethod
+    def from_store(store, sample_seed, sample_size):
+        obj = DataModel(store.get_sample(sample_seed, sample_size), store.version, sample_seed)
+        obj.sample_size = sample_size
+        return obj
+
     def to_json(self):
         return dict(
-            data=serialize_pd(self.data),
-            original_data=serialize_pd(self.original_data),
+            data_version=self.data_version,
+            sample_seed=self.sample_seed,
+            sample_size=self.sample_size,
             rep_state_vote_constraints=self.rep_state_vote_constraints,
             rep_natl_vote_constraint=self.rep_natl_vote_constraint,
             rep_ec_vote_constraint=self.rep_ec_vote_constraint,
@@ -51,38 +73,216 @@ class DataModel:
 
     @staticmethod
     def from_json(json_data):
-        obj = DataModel(None)
-        obj.data = deserialize_pd(json_data["data"])
-        obj.original_data = deserialize_pd(json_data["original_data"])
+        store = data_store.get_store_version(json_data["data_version"])
+        data_changed = json_data["data_changed"]
+        if store is None:
+            # the data snapshot of this session was retired, continue on the current data
+            store = data_store.get_store()
+            data_changed = True
+        obj = DataModel.from_store(store, json_data["sample_seed"], json_data["sample_size"])
         obj.rep_state_vote_constraints = json_data["rep_state_vote_constraints"]
         obj.rep_natl_vote_constraint = json_data["rep_natl_vote_constraint"]
         obj.rep_ec_vote_constraint = json_data["rep_ec_vote_constraint"]
         obj.rep_states_win_constraint = json_data["rep_states_win_constraint"]
-        obj.data_changed = json_data["data_changed"]
+        obj.data_changed = data_changed
+        obj._invalidate()
         return obj
 
-    def _filter_data(self):
-        self._filter_states_vote()
-        self._filter_ec()
-        self._filter_natl_vote()
-        self._filter_states_win()
+    # equal constraint sets get equal keys, whatever order they were set in
+    def get_constraints_key(self):
+        def normalize(interval, full_interval):
+            return max(float(interval[0]), full_interval[0]), min(float(interval[1]), full_interval[1])
+
+        return (
+            tuple(
+                (s, *normalize(interval, (0, 1))) for s, interval in sorted(self.rep_state_vote_constraints.items())
+                if not is_subinterval((0, 1), interval)
+            ),
+            normalize(self.rep_natl_vote_constraint, (0, 1)),
+            normalize(self.rep_ec_vote_constraint, (0, 538)),
+            normalize(self.rep_states_win_constraint, (0, 51)),
+        )
 
-    def _filter_states_vote(self):
-        for s in self.rep_state_vote_constraints.keys():
-            self._filter_state_vote(s)
+    def _get_selection_key(self):
+        return self.sample_seed, self.sample_size, self.get_constraints_key()
+
+    # the filtered view is only built when something reads it, figures and summaries
+    # of cached constraint sets never need it
+    @property
+    def data(self):
+        if self._data is None:
+            self._materialize()
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self.rows = None
+
+    def _invalidate(self):
+        self._data = None
+        self.rows = None
+
+    def _materialize(self):
+        if self.rows is None and self.violations is None:
+            store = data_store.get_store_version(self.data_version) if self.data_version is not None else None
+            self.rows = None if store is None else store.get_selection(self._get_selection_key())
+        if self.rows is not None:
+            self._data = self.original_data.iloc[self.rows]
+            return
+        if self.violations is not None:
+            if len(self.constraint_masks) == 0:
+                self.data = self.original_data
+            else:
+                self.data = self.original_data.loc[self.violations == 0]
+        else:
+            self._filter_data()
+        self._cache_selection()
+
+    # the rows of a view built for new constraints, other sessions with the same constraints start from them
+    def _cache_selection(self):
+        store = data_store.get_store_version(self.data_version) if self.data_version is not None else None
+        key = self._get_selection_key()
+        if store is None or (self.rows is None and self._data is None) or store.has_selection(key):
+            return
+        rows = self.rows
+        if rows is None:
+            # samples and filtered views keep the store row order
+            rows = np.searchsorted(self.original_data.index.to_numpy(), self._data.index.to_numpy())
+        store.set_selection(key, rows)
 
-    def _filter_state_vote(self, state):
-        (f, t) = self.rep_state_vote_constraints[state]
-        self.data = data_filters.filter_rep_state_vote_range(self.data, state, f, t)
+    # rebuilds the filtered view from the original data, one mask and at most one copy
+    def _filter_data(self):
+        constraints = (
+            self.rep_state_vote_constraints,
+            self.rep_natl_vote_constraint,
+            self.rep_ec_vote_constraint,
+            self.rep_states_win_constraint
+        )
+        column_index = self._get_column_index()
+        if column_index is not None:
+            rows = data_filters.get_constraints_rows(self.original_data, column_index, *constraints)
+            if rows is not None:
+                self.data = self.original_data.iloc[rows]
+                return
+
+        mask = data_filters.get_constraints_mask(self.original_data, *constraints)
+        self.data = self.original_data if mask is None else self.original_data.loc[mask]
+
+    def _get_column_index(self):
+        store = data_store.get_store_version(self.data_version) if self.data_version is not None else None
+        if store is None:
+            return None
+        return store.get_sample_index(self.sample_seed, self.sample_size)
+
+    def _get_constraint_mask(self, name, interval):
+        if data_filters.is_full_interval(interval, data_filters.get_full_interval(name)):
+            return None
+        store = data_store.get_store_version(self.data_version) if self.data_version is not None else None
+        key = (self.sample_seed, self.sample_size, name, tuple(float(v) for v in interval))
+        mask = None if store is None else store.get_mask(key)
+        if mask is None:
+            mask = data_filters.get_constraint_mask(self.original_data, name, interval)
+            if mask is not None and store is not None:
+                store.set_mask(key, mask)
+        return mask
+
+    def _build_violations(self):
+        self.constraint_masks = {}
+        self.violations = np.zeros(len(self.original_data), dtype=np.uint8)
+        constraints = data_filters.get_constraint_items(
+            self.rep_state_vote_constraints,
+            self.rep_natl_vote_constraint,
+            self.rep_ec_vote_constraint,
+            self.rep_states_win_constraint
+        )
+        for name, interval in constraints:
+            self._set_constraint_mask(name, interval)
+
+    def _set_constraint_mask(self, name, interval):
+        old_mask = self.constraint_masks.pop(name, None)
+        if old_mask is not None:
+            self.violations -= ~old_mask
+        mask = self._get_constraint_mask(name, interval)
+        if mask is not None:
+            self.constraint_masks[name] = mask
+            self.violations += ~mask
+
+    def _get_interval(self, name):
+        if name == "natl_pop_vote":
+            return self.rep_natl_vote_constraint
+        if name == "dem_ec":
+            return self.rep_ec_vote_constraint
+        if name == "n_states_won":
+            return self.rep_states_win_constraint
+        return self.rep_state_vote_constraints[name]
+
+    # the interval of one constraint changed from old_interval to new_interval,
+    # inside a batch the change is only recorded and applied when the batch ends
+    def _update_constraint(self, name, old_interval, new_interval):
+        if self.batch_changes is not None:
+            self.batch_changes.setdefault(name, old_interval)
+            return
+        self._update_constraints({name: (old_interval, new_interval)})
 
-    def _filter_ec(self):
-        self.data = data_filters.filter_rep_electoral_college_range(self.data, *self.rep_ec_vote_constraint)
+    # changes map constraint names to their (old_interval, new_interval), the view is rebuilt once
+    def _update_constraints(self, changes):
+        if self.violations is None and self._data is None:
+            # the view was not built yet, it is filtered for the new constraints when it is read
+            self._invalidate()
+            return
+        if self.violations is None and all(is_subinterval(new, old) for old, new in changes.values()):
+            # tighter intervals only remove rows from the current view
+            mask = data_filters.get_constraints_mask(
+                self.data, *self._get_changed_constraints(changes)
+            )
+            if mask is not None:
+                self.data = self.data.loc[mask]
+                self._cache_selection()
+            return
+        if self.violations is None:
+            self._build_violations()
+        else:
+            for name, (_, new_interval) in changes.items():
+                self._set_constraint_mask(name, new_interval)
+        self._invalidate()
 
-    def _filter_natl_vote(self):
-        self.data = data_filters.filter_rep_natl_vote_range(self.data, *self.rep_natl_vote_constraint)
+    @staticmethod
+    def _get_changed_constraints(changes):
+        rep_state_vote_constraints = {}
+        constraints = dict(natl_pop_vote=(0, 1), dem_ec=(0, 538), n_states_won=(0, 51))
+        for name, (_, new_interval) in changes.items():
+            if name in constraints:
+                constraints[name] = new_interval
+            else:
+                rep_state_vote_constraints[name] = new_interval
+        return (
+            rep_state_vote_constraints,
+            constraints["natl_pop_vote"],
+            constraints["dem_ec"],
+            constraints["n_states_won"]
+        )
 
-    def _filter_states_win(self):
-        self.data = data_filters.filter_rep_n_states_win_range(self.data, *self.rep_states_win_constraint)
+    # constraint changes made inside the block are applied together when it exits,
+    # the filtered view is recomputed at most once
+    @contextmanager
+    def batch(self):
+        if self.batch_changes is not None:
+            yield self
+            return
+        self.batch_changes = {}
+        try:
+            yield self
+        finally:
+            batch_changes, self.batch_changes = self.batch_changes, None
+            with self.data_lock:
+                changes = {
+                    name: (old_interval, self._get_interval(name))
+                    for name, old_interval in batch_changes.items()
+                    if not same_interval(old_interval, self._get_interval(name))
+                }
+                if len(changes) > 0:
+                    self._update_constraints(changes)
 
     def add_state_vote_constraint(self, state, f=None, t=None):
         with self.data_lock:
@@ -93,10 +293,8 @@ class DataModel:
         new_interval = fill_interval_none((f, t), old_interval)
         if same_interval(new_interval, old_interval):
             return
-        if not is_subinterval(new_interval, old_interval):
-            self._remove_state_vote_constraint(state)
         self.rep_state_vote_constraints[state] = new_interval
-        self._filter_state_vote(state)
+        self._update_constraint(state, old_interval, new_interval)
         self.data_changed = True
 
     def add_natl_vote_constraint(self, f=None, t=None):
@@ -108,10 +306,8 @@ class DataModel:
         new_interval = fill_interval_none((f, t), old_interval)
         if same_interval(new_interval, old_interval):
             return
-        if not is_subinterval(new_interval, old_interval):
-            self._remove_natl_vote_constraint()
         self.rep_natl_vote_constraint = new_interval
-        self._filter_natl_vote()
+        self._update_constraint("natl_pop_vote", old_interval, new_interval)
         self.data_changed = True
 
     def add_ec_vote_constraint(self, f=None, t=None):
@@ -123,10 +319,8 @@ class DataModel:
         new_interval = fill_interval_none((f, t), old_interval)
         if same_interval(new_interval, old_interval):
             return
-        if not is_subinterval(new_interval, old_interval):
-            self._remove_ec_vote_constraint()
         self.rep_ec_vote_constraint = new_interval
-        self._filter_ec()
+        self._update_constraint("dem_ec", old_interval, new_interval)
         self.data_changed = True
 
     def add_states_win_constraint(self, f=None, t=None):
@@ -138,33 +332,10 @@ class DataModel:
         new_interval = fill_interval_none((f, t), old_interval)
         if same_interval(new_interval, old_interval):
             return
-        if not is_subinterval(new_interval, old_interval):
-            self._remove_states_win_constraint()
         self.rep_states_win_constraint = new_interval
-        self._filter_states_win()
+        self._update_constraint("n_states_won", old_interval, new_interval)
         self.data_changed = True
 
-    def _remove_state_vote_constraint(self, state):
-        interval = self.rep_state_vote_constraints.get(state, (0, 1))
-        if not same_interval(interval, (0, 1)):
-            self.rep_state_vote_constraints[state] = (0, 1)
-            self._reset_filter()
-
-    def _remove_natl_vote_constraint(self):
-        if not same_interval(self.rep_natl_vote_constraint, (0, 1)):
-            self.rep_natl_vote_constraint = (0, 1)
-            self._reset_filter()
-
-    def _remove_ec_vote_constraint(self):
-        if not same_interval(self.rep_ec_vote_constraint, (0, 538)):
-            self.rep_ec_vote_constraint = (0, 538)
-            self._reset_filter()
-
-    def _remove_states_win_constraint(self):
-        if not same_interval(self.rep_states_win_constraint, (0, 51)):
-            self.rep_states_win_constraint = (0, 51)
-            self._reset_filter()
-
     def reset_data(self):
         with self.data_lock:
             for s in states:
@@ -182,17 +353,40 @@ class DataModel:
                 self.data_changed = True
 
             self._reset()
+            if self.batch_changes is not None:
+                self.batch_changes = {}
 
     def _reset(self):
-        self.data = self.original_data.copy()
-
-    def _reset_filter(self):
-        self._reset()
-        self._filter_data()
-
-    def get_random_sample(self):
+        self.data = self.original_data
+        self.constraint_masks = None
+        self.violations = None
+
+    # statistics of the filtered view, shared with every session that filters the same sample the same way
+    def get_statistics(self):
+        store = data_store.get_store_version(self.data_version) if self.data_version is not None else None
+        key = self._get_selection_key()
+        if self.statistics is not None and self.statistics[0] == key:
+            return self.statistics[1]
+        statistics = None if store is None else store.get_statistics(key)
+        if statistics is None:
+            statistics = ViewStatistics(self.data)
+            if store is not None:
+                store.set_statistics(key, statistics)
+        self.statistics = (key, statistics)
+        return statistics
+
+    def get_random_sample_id(self):
         with self.data_lock:
             if len(self.data) > 0:
-                return self.data.iloc[[random.choice(range(len(self.data)))]]
+                return int(self.data.index[random.choice(range(len(self.data)))])
             else:
-                return self.data.iloc[[]]
+                return None
+
+    def get_sample_by_id(self, sample_id):
+        store = data_store.get_store_version(self.data_version) if self.data_version is not None else None
+        if store is not None:
+            return expand_data(store.get_row(sample_id))
+        # the store version was retired, the id is a row of this model's sample
+        if sample_id is None or sample_id not in self.original_data.index:
+            return expand_data(self.original_data.iloc[[]])
+        return expand_data(self.original_data.loc[[sample_id]])
@@ -0,0 +1,63 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+import os
+
+
+# threads that evaluate masks and partial aggregates of large frames, 1 to run everything inline,
+# numpy releases the GIL inside its loops so the chunks run on separate cores
+parallel_threads = int(os.environ.get("PARALLEL_THREADS", 1))
+# frames with fewer rows than this are never split
+parallel_min_rows = int(os.environ.get("PARALLEL_MIN_ROWS", 1000000))
+
+_executor = None
+_executor_lock = Lock()
+
+
+# the threads of an executor created in the preloaded master do not survive the fork of its workers,
+# each worker creates its own on first use
+def _reset_after_fork():
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=parallel_threads, thread_name_prefix="data_parallel")
+    return _executor
+
+
+def get_chunks(n):
+    if parallel_threads <= 1 or n < parallel_min_rows:
+        return [slice(0, n)]
+    bounds = [n * k // parallel_threads for k in range(parallel_threads + 1)]
+    return [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+# func gets a slice of the rows, results are returned in row order
+def map_chunks(func, n):
+    chunks = get_chunks(n)
+    if len(chunks) == 1:
+        return [func(chunks[0])]
+    return list(get_executor().map(func, chunks))
+
+
+# func gets the rows of a chunk as a frame, the frame itself when it is not split
+def map_frame_chunks(func, data):
+    n = len(data)
+    return map_chunks(lambda rows: func(data if rows == slice(0, n) else data.iloc[rows]), n)
+
+
+def sum_chunks(func, n):
+    results = map_chunks(func, n)
+    total = results[0]
+    for r in results[1:]:
+        total = total + r
+    return total
@@ -0,0 +1,120 @@
+from collections import namedtuple
+from threading import Lock
+import data_functions
+import data_parallel
+import numpy as np
+
+
+# bins of a histogram split by the winner of the simulations, edges is None when there is nothing to bin
+Histogram = namedtuple("Histogram", ["edges", "rep_counts", "dem_counts"])
+
+
+def get_bins_dict(values, n_bins=None):
+    if len(values) == 0:
+        return dict(start=np.nan, end=np.nan, size=np.nan)
+    nv_min = np.ceil(values.min() * 100) / 100
+    nv_max = np.floor(values.max() * 100) / 100
+    if nv_max <= nv_min:
+        # all values within one percent step, one bin around them
+        nv_min = np.floor(values.min() * 100) / 100
+        nv_max = max(np.ceil(values.max() * 100) / 100, nv_min + 0.01)
+    if n_bins is None:
+        n_bins = min(50., max(10., len(values) / 100))
+    step = (nv_max - nv_min) / n_bins
+    return dict(start=nv_min, end=nv_max, size=step)
+
+
+def get_bin_edges(bins_dict):
+    start, end, size = bins_dict["start"], bins_dict["end"], bins_dict["size"]
+    if not (np.isfinite(start) and np.isfinite(end) and size > 0):
+        return None
+    n_bins = max(1, int(np.ceil(np.round((end - start) / size, 6))))
+    return start + size * np.arange(n_bins + 1)
+
+
+def get_histogram(values, rep_win, bins_dict):
+    edges = get_bin_edges(bins_dict)
+    if edges is None:
+        return Histogram(None, None, None)
+
+    def count_chunk(rows):
+        # the edges are rounded to whole percents, the few values past them go to the outer bins
+        chunk = np.clip(values[rows], edges[0], edges[-1])
+        chunk_rep_win = rep_win[rows]
+        return np.stack([np.histogram(chunk[chunk_rep_win], edges)[0], np.histogram(chunk[~chunk_rep_win], edges)[0]])
+
+    counts = data_parallel.sum_chunks(count_chunk, len(values))
+    return Histogram(edges, counts[0], counts[1])
+
+
+def get_state_vote_histogram(data, state, rep_win=None):
+    rep_state_pop_vote = 100 * (1 - data_functions.get_dem_share(data, state).to_numpy())
+    if rep_win is None:
+        rep_win = rep_state_pop_vote > 50
+    return get_histogram(rep_state_pop_vote, rep_win, get_bins_dict(rep_state_pop_vote))
+
+
+def get_natl_vote_histogram(data, rep_win):
+    rep_natl_pop_vote = 100 * (1 - data_functions.get_dem_share(data, "natl_pop_vote").to_numpy())
+    return get_histogram(rep_natl_pop_vote, rep_win, get_bins_dict(rep_natl_pop_vote))
+
+
+def get_ec_vote_histogram(data, rep_win):
+    rep_ec_vote = 538 - data["dem_ec"].to_numpy().astype(np.int64)
+    if len(rep_ec_vote) == 0:
+        return Histogram(None, None, None)
+
+    a = rep_ec_vote.min() - 0.5
+    b = rep_ec_vote.max()
+
+    mid = 268.5
+    size = 4
+
+    k_left = np.ceil((mid - a) / size)
+    return get_histogram(rep_ec_vote, rep_win, dict(start=mid - size * k_left, end=b, size=size))
+
+
+def get_n_states_win_histogram(data, rep_win):
+    rep_n_states_won = data_functions.get_rep_number_state_wins(data).to_numpy()
+    if len(rep_n_states_won) == 0:
+        return Histogram(None, None, None)
+    bins_dict = dict(start=rep_n_states_won.min() - 0.5, end=rep_n_states_won.max(), size=1)
+    return get_histogram(rep_n_states_won, rep_win, bins_dict)
+
+
+# everything the figures and the summary show about one filtered view, the summary is computed in
+# one pass over the view, histograms are added when a figure first asks for them
+class ViewStatistics:
+    def __init__(self, data):
+        dem_ec = data["dem_ec"].to_numpy()
+        self.n = len(data)
+        self.rep_win = dem_ec < 270
+        self.chance_dem_win = data_functions.get_chance_dem_win(data)
+        self.win_statistics = data_functions.win_statistics(data)
+        self.histograms = {}
+        self.lock = Lock()
+
+    # get_data returns the view the statistics were computed for, it is only called for new histograms
+    def _get_histogram(self, key, get_histogram, get_data):
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = get_histogram(get_data())
+            with self.lock:
+                self.histograms[key] = histogram
+        return histogram
+
+    def get_natl_vote_histogram(self, get_data):
+        return self._get_histogram("natl_vote", lambda data: get_natl_vote_histogram(data, self.rep_win), get_data)
+
+    def get_ec_vote_histogram(self, get_data):
+        return self._get_histogram("ec_vote", lambda data: get_ec_vote_histogram(data, self.rep_win), get_data)
+
+    def get_n_states_win_histogram(self, get_data):
+        return self._get_histogram(
+            "n_states_win", lambda data: get_n_states_win_histogram(data, self.rep_win), get_data
+        )
+
+    def get_state_vote_histogram(self, state, get_data):
+        return self._get_histogram(
+            ("state_vote", state), lambda data: get_state_vote_histogram(data, state, self.rep_win), get_data
+        )
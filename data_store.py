@@ -0,0 +1,226 @@
+from collections import OrderedDict
+from threading import Lock, Thread
+import state_const
+import data_cache
+import data_functions
+from data_index import ColumnIndex
+from result_cache import ResultCache
+import random
+import shutil
+import time
+import os
+
+
+data_folder = os.environ.get("ELECTION_DATA_FOLDER")
+# "uint16" or "float32" to keep vote shares in a compact representation
+compact_share_dtype = os.environ.get("COMPACT_DATA")
+# seconds between checks of the data folder for new or changed files, 0 to disable
+watch_interval = float(os.environ.get("DATA_WATCH_INTERVAL", 60))
+# number of store versions kept alive for sessions started on an older version
+keep_store_versions = int(os.environ.get("KEEP_STORE_VERSIONS", 2))
+# sessions draw their subsample from a fixed pool of seeds, so samples can be shared and cached
+sample_pool_size = int(os.environ.get("SAMPLE_POOL_SIZE", 8))
+# holds at least the whole pool, a smaller cache would evict samples that sessions keep asking for
+sample_cache_size = max(int(os.environ.get("SAMPLE_CACHE_SIZE", sample_pool_size)), sample_pool_size)
+# megabytes for the filter results shared by all sessions of a store version,
+# the row selections and statistics of constraint sets
+result_cache_mb = float(os.environ.get("RESULT_CACHE_MB", 64))
+# megabytes for the masks of single constraints, one byte per sampled row each
+mask_cache_mb = float(os.environ.get("MASK_CACHE_MB", 32))
+
+
+# the store, its samples and everything in its caches are read by the request threads of a worker
+# at once, their arrays are made read-only so that a stray in-place operation fails instead of
+# changing the data under another request
+def freeze(frame):
+    for block in frame._mgr.blocks:
+        block.values.flags.writeable = False
+    return frame
+
+
+class SimulationStore:
+    def __init__(self, data, version=None, folder=None, share_dtype=None, cache_folder=None):
+        validate_data(data)
+        if share_dtype:
+            data = data_functions.compact_data(data, share_dtype)
+        self.data = freeze(data)
+        self.version = version
+        self.folder = folder
+        self.cache_folder = cache_folder
+        self.samples = OrderedDict()
+        self.results = ResultCache(int(result_cache_mb * 2 ** 20))
+        self.masks = ResultCache(int(mask_cache_mb * 2 ** 20))
+        self.cache_lock = Lock()
+        # a sample missing from the cache is built by one request, the others wait for it
+        self.sample_build_lock = Lock()
+
+    def __len__(self):
+        return len(self.data)
+
+    @staticmethod
+    def new_sample_seed():
+        return random.randrange(sample_pool_size)
+
+    def get_sample(self, seed, n):
+        return self._get_indexed_sample(seed, n)[0]
+
+    # sorted column indexes of a sample, shared by every session of that sample
+    def get_sample_index(self, seed, n):
+        return self._get_indexed_sample(seed, n)[1]
+
+    def _get_cached_sample(self, key):
+        with self.cache_lock:
+            if key in self.samples:
+                self.samples.move_to_end(key)
+                return self.samples[key]
+        return None
+
+    def _get_indexed_sample(self, seed, n):
+        key = (seed, n)
+        indexed_sample = self._get_cached_sample(key)
+        if indexed_sample is not None:
+            return indexed_sample
+
+        with self.sample_build_lock:
+            indexed_sample = self._get_cached_sample(key)
+            if indexed_sample is not None:
+                return indexed_sample
+            rows = sorted(random.Random(seed).sample(range(len(self.data)), min(n, len(self.data))))
+            sample = freeze(self.data.iloc[rows])
+            with self.cache_lock:
+                self.samples[key] = (sample, ColumnIndex(sample))
+                while len(self.samples) > sample_cache_size:
+                    self.samples.popitem(last=False)
+                return self.samples[key]
+
+    def get_row(self, row_id):
+        if row_id is None or row_id >= len(self.data):
+            return self.data.iloc[[]]
+        return self.data.iloc[[row_id]]
+
+    # row positions of filtered views, keyed by sample and canonical constraints
+    def get_selection(self, key):
+        return self.results.get(("rows", key))
+
+    def has_selection(self, key):
+        return ("rows", key) in self.results
+
+    def set_selection(self, key, rows):
+        rows.flags.writeable = False
+        self.results.put(("rows", key), rows)
+
+    # statistics of filtered views, same keys as the selections
+    def get_statistics(self, key):
+        return self.results.get(("statistics", key))
+
+    def set_statistics(self, key, statistics):
+        self.results.put(("statistics", key), statistics)
+
+    # masks of single constraints, keyed by sample, constraint name and interval
+    def get_mask(self, key):
+        return self.masks.get(key)
+
+    def set_mask(self, key, mask):
+        mask.flags.writeable = False
+        self.masks.put(key, mask)
+
+    def get_cache_stats(self):
+        return dict(version=self.version, results=self.results.stats(), masks=self.masks.stats())
+
+    # a private cache is built when the one in the data folder cannot be written
+    def has_private_cache(self):
+        return self.cache_folder is not None and self.cache_folder != data_cache.get_cache_folder(self.folder)
+
+    @staticmethod
+    def load(folder, private_folder=None):
+        data, version, cache_folder = data_cache.load_data(folder, private_folder=private_folder)
+        return SimulationStore(data, version, folder, compact_share_dtype, cache_folder)
+
+
+# the vote shares themselves are checked once when the cache is built, not on every load
+def validate_data(data):
+    columns = state_const.states + ["natl_pop_vote", "dem_ec"]
+    missing = [c for c in columns if c not in data.columns]
+    if len(missing) > 0:
+        raise ValueError(f"Simulation data is missing columns {missing}")
+    if len(data) == 0:
+        raise ValueError("Simulation data is empty")
+
+
+_store = None
+_stores = OrderedDict()
+_store_lock = Lock()
+_reload_lock = Lock()
+_watcher = None
+
+
+def _set_store(store):
+    global _store
+    with _store_lock:
+        _stores[store.version] = store
+        _stores.move_to_end(store.version)
+        while len(_stores) > keep_store_versions:
+            _stores.popitem(last=False)
+        _store = store
+
+
+def get_store():
+    if _store is None:
+        with _reload_lock:
+            if _store is None:
+                _set_store(SimulationStore.load(data_folder))
+                print("simulation store loaded", _store.version, len(_store))
+    return _store
+
+
+def get_store_version(version):
+    with _store_lock:
+        return _stores.get(version)
+
+
+# call when the content of the data folder changes, the new version is swapped in at once,
+# requests that already hold the previous store keep a consistent snapshot
+def reload_store(folder=None):
+    folder = folder or data_folder
+    with _reload_lock:
+        old_store = _store
+        private_folder = None
+        if old_store is not None and old_store.folder == folder and old_store.has_private_cache():
+            private_folder = old_store.cache_folder
+        new_store = SimulationStore.load(folder, private_folder)
+        _set_store(new_store)
+        # stores still holding the old private cache keep their mapped pages after the unlink
+        if private_folder is not None and new_store.cache_folder != private_folder:
+            shutil.rmtree(private_folder, ignore_errors=True)
+    print("simulation store reloaded", new_store.version, len(new_store))
+    return new_store
+
+
+# every worker checks the manifest, the first one to find it stale rebuilds the shared cache under its
+# lock, the others skip their checks while it builds and then only open the new version
+def check_for_updates():
+    store = get_store()
+    version = data_cache.get_current_version(store.folder, store.cache_folder)
+    if version == store.version:
+        return
+    if version is None and not store.has_private_cache() and data_cache.is_building(store.cache_folder):
+        return
+    reload_store(store.folder)
+
+
+def _watch(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            check_for_updates()
+        except Exception as e:
+            print("simulation data update failed", e)
+
+
+def start_watcher(interval=None):
+    global _watcher
+    interval = watch_interval if interval is None else interval
+    if interval <= 0 or (_watcher is not None and _watcher.is_alive()):
+        return
+    _watcher = Thread(target=_watch, args=(interval,), daemon=True, name="simulation_data_watcher")
+    _watcher.start()
@@ -0,0 +1,14 @@
+import os
+
+
+bind = "0.0.0.0"
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+
+# build the app, and with it the simulation store, in the master process before forking,
+# the workers then share the read-only pages of the memory-mapped simulation cache
+preload_app = os.environ.get("PRELOAD_APP", "1") != "0"
+
+# WORKER_THREADS > 1 runs that many request threads in every worker (the gthread worker),
+# the requests are cpu bound so sync stays the default, see benchmarks/worker_throughput.py in the README
+threads = int(os.environ.get("WORKER_THREADS", 1))
+worker_class = "gthread" if threads > 1 else "sync"
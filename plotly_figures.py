@@ -1,6 +1,7 @@
 import plotly.graph_objects as go
 import state_const
 import data_functions
+import data_statistics
 import numpy as np
 
 
@@ -12,12 +13,14 @@ colorscale2 = [[0, "red"], [0.5, "white"], [1, "blue"]]
 
 
 def fig_empty_us_map():
-    fig = go.Figure(data=go.Choropleth(
-        locations=state_const.states,
-        locationmode='USA-states',
-    ))
-    fig.update_layout(geo_scope='usa')
-    return fig
+    if "empty" not in _map_skeletons:
+        fig = go.Figure(data=go.Choropleth(
+            locations=state_const.states,
+            locationmode='USA-states',
+        ))
+        fig.update_layout(geo_scope='usa')
+        _map_skeletons["empty"] = fig.to_dict()
+    return _map_skeletons["empty"]
 
 
 def get_ec_size_labels(states=None):
@@ -47,151 +50,116 @@ def get_ec_size_labels(states=None):
     )
 
 
-def fig_dem_vote_share(vote_share_data, colors_as_share=False):
-    def state_text(s):
-        lines = [f"{s} vote share"]
+# figures are validated by plotly once, as skeletons, and sent as plain dicts where only the
+# arrays that change are replaced, the skeletons themselves are never modified
+def _get_us_map_skeleton(hovertemplate):
+    fig = go.Figure(data=[
+        go.Choropleth(
+            locations=state_const.states,
+            z=[0] * len(state_const.states),
+            locationmode="USA-states",
+            colorscale=colorscale1,
+            hovertemplate=hovertemplate,
+            showscale=False
+        ),
+        get_ec_size_labels()
+    ])
+    fig.update_layout(geo_scope="usa")
+    return fig.to_dict()
+
+
+_map_skeletons = {}
+
+
+def _get_map_skeleton(name, hovertemplate):
+    if name not in _map_skeletons:
+        _map_skeletons[name] = _get_us_map_skeleton(hovertemplate)
+    return _map_skeletons[name]
 
-        trump_line = f"- Trump: {100 - vote_share_data[s] * 100:.2f}%"
-        biden_line = f"- Biden: {vote_share_data[s] * 100:.2f}%"
-        if vote_share_data[s] >= 0.5:
-            lines += [biden_line, trump_line]
-        else:
-            lines += [trump_line, biden_line]
 
-        return "<br>".join(lines)
+def _patch_map(skeleton, **choropleth):
+    choropleth_trace, labels_trace = skeleton["data"]
+    return dict(skeleton, data=[dict(choropleth_trace, **choropleth), labels_trace])
 
+
+def fig_dem_vote_share(vote_share_data, colors_as_share=False):
     states = list(state_const.states)
+    dem_share = vote_share_data[states].to_numpy(np.float64)
     if colors_as_share:
-        z = vote_share_data[states]
         clip_min = 0.39
         clip_max = 0.61
-        z = np.clip(z, clip_min, clip_max)
+        z = np.clip(dem_share, clip_min, clip_max)
 
         color_offset = 0.05
-        z = (
-            (z >= 0.5) * color_offset +
-            (z < 0.5) * (-color_offset) +
-            z
-        )
+        z = z + np.where(z >= 0.5, color_offset, -color_offset)
         zmin = clip_min - color_offset
         zmax = clip_max + color_offset
     else:
-        z = 1 * (vote_share_data[states] >= 0.5)
+        z = 1 * (dem_share >= 0.5)
         zmin = 0
         zmax = 1
 
-    fig = go.Figure(data=[
-        go.Choropleth(
-            text=[state_text(s) for s in states],
-            hoverinfo="text",
-            locations=states,
-            z=z,
-            locationmode='USA-states',
-            colorscale=colorscale1,
-            zmid=0.5, zmin=zmin, zmax=zmax
-        ),
-    ])
-
-    fig.update_traces(showscale=False)
-
-    fig.add_trace(
-        get_ec_size_labels()
+    # the winner is listed first
+    dem_first = dem_share >= 0.5
+    rep_share = 100 - dem_share * 100
+    customdata = [list(row) for row in zip(
+        np.where(dem_first, "Biden", "Trump").tolist(),
+        np.where(dem_first, dem_share * 100, rep_share).tolist(),
+        np.where(dem_first, "Trump", "Biden").tolist(),
+        np.where(dem_first, rep_share, dem_share * 100).tolist()
+    )]
+
+    skeleton = _get_map_skeleton(
+        "vote_share",
+        "%{location} vote share<br>- %{customdata[0]}: %{customdata[1]:.2f}%"
+        "<br>- %{customdata[2]}: %{customdata[3]:.2f}%<extra></extra>"
     )
+    return _patch_map(skeleton, z=z.tolist(), customdata=customdata, zmid=0.5, zmin=zmin, zmax=zmax)
 
-    fig.update_layout(geo_scope='usa')
-
-    return fig
-
-
-def fig_chance_dem_win(data):
-    n = len(data)
-
-    if n == 0:
-        return fig_empty_us_map()
 
-    chance_dem_win = data_functions.get_chance_dem_win(data)
+# data is only read when chance_dem_win is not given
+def fig_chance_dem_win(data, chance_dem_win=None):
+    if chance_dem_win is None:
+        if len(data) == 0:
+            return fig_empty_us_map()
+        chance_dem_win = data_functions.get_chance_dem_win(data)
 
-    def state_text(s):
-        lines = [
-            f"Chance to win {s}",
-            f"- Trump: {100 - chance_dem_win[s] * 100:.2f}%",
-            f"- Biden: {chance_dem_win[s] * 100:.2f}%"
-        ]
-        return "<br>".join(lines)
-
-    fig = go.Figure(data=go.Choropleth(
-        text=[state_text(s) for s in state_const.states],
-        hoverinfo="text",
-        locations=state_const.states,
-        z=chance_dem_win[state_const.states].to_list(),
-        locationmode='USA-states',
-        colorscale=colorscale1,
-        zmin=0, zmid=0.5, zmax=1
-    )
+    chance = chance_dem_win[state_const.states].to_numpy(np.float64)
+    skeleton = _get_map_skeleton(
+        "chance_dem_win",
+        "Chance to win %{location}<br>- Trump: %{customdata[0]:.2f}%<br>- Biden: %{customdata[1]:.2f}%<extra></extra>"
     )
-
-    fig.update_traces(showscale=False)
-
-    fig.add_trace(
-        get_ec_size_labels()
+    return _patch_map(
+        skeleton,
+        z=chance.tolist(),
+        customdata=np.stack([100 - chance * 100, chance * 100], axis=1).tolist(),
+        zmin=0, zmid=0.5, zmax=1
     )
 
-    fig.update_layout(geo_scope='usa')
 
-    return fig
+_ec_bar_skeleton = None
 
 
-def fig_ec_bar(data):
-    chance_dem_win = data_functions.get_chance_dem_win(data)
-    sorted_chance_dem_win_keys = sorted(state_const.states, key=lambda k: (1 - chance_dem_win[k], k))
-    sorted_chance_dem_win = np.array([chance_dem_win[s] for s in sorted_chance_dem_win_keys])
-    winner_lbl = {}
-    for s in state_const.states:
-        p_b = 100 * chance_dem_win[s]
-        p_t = 100 * (1 - chance_dem_win[s])
-        if chance_dem_win[s] < 0.5:
-            winner_lbl[s] = f"Trump {p_t:.0f}%"
-        elif chance_dem_win[s] > 0.5:
-            winner_lbl[s] = f"Biden {p_b:.0f}%"
-        else:
-            winner_lbl[s] = "Tie"
+# one horizontal bar trace, every state is a segment that starts where the previous one ends
+def _get_ec_bar_skeleton():
+    global _ec_bar_skeleton
+    if _ec_bar_skeleton is not None:
+        return _ec_bar_skeleton
 
     fig = go.Figure(data=[
         go.Bar(
-            name=s, orientation="h", x=[state_const.ec_vote_size[s]], y=[0], width=[1],
+            orientation="h", y=[0], x=[1], base=[0], width=1,
             hoverinfo="text",
-            hovertext=f"{s}:{state_const.ec_vote_size[s]}<br>{winner_lbl[s]}",
-            marker=dict(
-                colorscale=colorscale1,
-                color=[chance_dem_win[s]],
-                cmin=0, cmid=0.5, cmax=1,
-            )
-        ) for s in sorted_chance_dem_win_keys
+            marker=dict(colorscale=colorscale1, color=[0.5], cmin=0, cmid=0.5, cmax=1)
+        )
     ])
-
-    ec_sizes = np.array([state_const.ec_vote_size[s] for s in sorted_chance_dem_win_keys])
-    trump_win = ec_sizes @ (sorted_chance_dem_win < 0.5)
-    biden_win = ec_sizes @ (sorted_chance_dem_win > 0.5)
-
-    step = 60
-    ticks = list(range(269 - step, -1, -step)) + list(range(269 + step, 538, step))
-    ec_sizes_cumsum = np.cumsum(ec_sizes)
-    for i, t in enumerate(ticks):
-        # get existing closest electoral college value
-        ticks[i] = ec_sizes_cumsum[np.abs(ec_sizes_cumsum - t).argsort()[0]]
-    ticks.extend([0, 269, 538])
-    tick_text = [f"{min(t, 538 - t)}" for t in ticks]
-
-    # Change the bar mode
     fig.update_layout(
-        barmode="stack",
+        barmode="overlay",
         yaxis=dict(
             fixedrange=True, showticklabels=False, range=[-0.5, 0.5]
         ),
         xaxis=dict(
             fixedrange=True, range=[0, 538],
-            tickvals=ticks,
-            ticktext=tick_text,
             tickmode="array"
         ),
         dragmode=False
@@ -202,14 +170,12 @@ def fig_ec_bar(data):
             dict(
                 x=0.08, y=2.3,
                 showarrow=False,
-                text=f"<b>Biden {biden_win}</b>",
                 xref="paper", yref="paper",
                 font=dict(size=24, color=d_blue)
             ),
             dict(
                 x=0.92, y=2.3,
                 showarrow=False,
-                text=f"<b>{trump_win} Trump</b>",
                 xref="paper", yref="paper",
                 font=dict(size=24, color=r_red)
             )
@@ -222,98 +188,116 @@ def fig_ec_bar(data):
             xref="x", x0=269, x1=269
         )
     ])
+    _ec_bar_skeleton = fig.to_dict()
+    return _ec_bar_skeleton
 
-    return fig
-
-
-def _get_bins_dict(data, n_bins=None):
-    nv_min = np.ceil(data.min() * 100) / 100
-    nv_max = np.floor(data.max() * 100) / 100
-    if n_bins is None:
-        n_bins = min(50., max(10., len(data) / 100))
-    step = (nv_max - nv_min) / n_bins
-    return dict(start=nv_min, end=nv_max, size=step)
 
+def fig_ec_bar(data, chance_dem_win=None):
+    if chance_dem_win is None:
+        chance_dem_win = data_functions.get_chance_dem_win(data)
+    sorted_chance_dem_win_keys = sorted(state_const.states, key=lambda k: (1 - chance_dem_win[k], k))
+    sorted_chance_dem_win = np.array([chance_dem_win[s] for s in sorted_chance_dem_win_keys])
+    ec_sizes = np.array([state_const.ec_vote_size[s] for s in sorted_chance_dem_win_keys])
 
-def _fig_rep_dem_hist(dem_data, rep_data, bins_dict):
-    fig = go.Figure(data=[
-        go.Histogram(
-            x=dem_data,
-            xbins=bins_dict,
-            marker=dict(color=r_red),
-            hoverinfo="skip"
-        ),
-        go.Histogram(
-            x=rep_data,
-            xbins=bins_dict,
-            marker=dict(color=d_blue),
-            hoverinfo="skip"
-        )],
-        layout=dict(barmode="stack", showlegend=False, yaxis=dict(fixedrange=True, rangemode="tozero"))
+    winner_lbl = np.where(
+        sorted_chance_dem_win < 0.5,
+        [f"Trump {p:.0f}%" for p in 100 * (1 - sorted_chance_dem_win)],
+        np.where(sorted_chance_dem_win > 0.5, [f"Biden {p:.0f}%" for p in 100 * sorted_chance_dem_win], "Tie")
     )
+    hovertext = [f"{s}:{size}<br>{lbl}" for s, size, lbl in zip(sorted_chance_dem_win_keys, ec_sizes, winner_lbl)]
 
-    return fig
+    trump_win = ec_sizes @ (sorted_chance_dem_win < 0.5)
+    biden_win = ec_sizes @ (sorted_chance_dem_win > 0.5)
 
+    step = 60
+    ticks = list(range(269 - step, -1, -step)) + list(range(269 + step, 538, step))
+    ec_sizes_cumsum = np.cumsum(ec_sizes)
+    for i, t in enumerate(ticks):
+        # get existing closest electoral college value
+        ticks[i] = ec_sizes_cumsum[np.abs(ec_sizes_cumsum - t).argsort()[0]]
+    ticks.extend([0, 269, 538])
+    tick_text = [f"{min(t, 538 - t)}" for t in ticks]
 
-def fig_rep_state_vote_hist(data, state, general_election_win_color=False):
-    rep_state_pop_vote = 100 * (1 - data[state])
-    bins_dict = _get_bins_dict(rep_state_pop_vote)
+    skeleton = _get_ec_bar_skeleton()
+    bar_trace = skeleton["data"][0]
+    layout = skeleton["layout"]
+    biden_annotation, trump_annotation = layout["annotations"]
+    return dict(
+        skeleton,
+        data=[dict(
+            bar_trace,
+            x=ec_sizes.tolist(),
+            base=(ec_sizes_cumsum - ec_sizes).tolist(),
+            y=[0] * len(ec_sizes),
+            hovertext=hovertext,
+            marker=dict(bar_trace["marker"], color=sorted_chance_dem_win.tolist())
+        )],
+        layout=dict(
+            layout,
+            xaxis=dict(layout["xaxis"], tickvals=[int(t) for t in ticks], ticktext=tick_text),
+            annotations=[
+                dict(biden_annotation, text=f"<b>Biden {biden_win}</b>"),
+                dict(trump_annotation, text=f"<b>{trump_win} Trump</b>")
+            ]
+        )
+    )
 
-    if general_election_win_color:
-        rep_idx = data["dem_ec"] < 270
-        dem_idx = data["dem_ec"] >= 270
-    else:
-        rep_idx = rep_state_pop_vote > 50
-        dem_idx = rep_state_pop_vote <= 50
 
-    fig = _fig_rep_dem_hist(
-        rep_state_pop_vote[rep_idx],
-        rep_state_pop_vote[dem_idx],
-        bins_dict
-    )
+_hist_skeleton = None
 
-    return fig
 
+def _get_hist_skeleton():
+    global _hist_skeleton
+    if _hist_skeleton is None:
+        fig = go.Figure(data=[
+            go.Bar(x=[0], y=[0], width=[1], marker=dict(color=r_red, line=dict(width=0)), hoverinfo="skip"),
+            go.Bar(x=[0], y=[0], width=[1], marker=dict(color=d_blue, line=dict(width=0)), hoverinfo="skip")],
+            layout=dict(
+                barmode="stack", bargap=0, showlegend=False,
+                yaxis=dict(fixedrange=True, rangemode="tozero")
+            )
+        )
+        _hist_skeleton = fig.to_dict()
+    return _hist_skeleton
 
-def fig_rep_n_states_win_hist(data):
-    rep_n_states_won = data_functions.get_rep_number_state_wins(data)
-    bins_dict = dict(start=rep_n_states_won.min() - 0.5, end=rep_n_states_won.max(), size=1)
 
-    fig = _fig_rep_dem_hist(
-        rep_n_states_won[data["dem_ec"] < 270],
-        rep_n_states_won[data["dem_ec"] >= 270],
-        bins_dict
+# bins are counted on the server and only the counts are sent to the browser, not every simulation
+def fig_rep_dem_hist(histogram):
+    if histogram.edges is None:
+        centers, widths, rep_counts, dem_counts = [], [], [], []
+        x_range = None
+    else:
+        edges = histogram.edges
+        centers = ((edges[:-1] + edges[1:]) / 2).tolist()
+        widths = np.diff(edges).tolist()
+        rep_counts = histogram.rep_counts.tolist()
+        dem_counts = histogram.dem_counts.tolist()
+        x_range = [float(edges[0]), float(edges[-1])]
+
+    skeleton = _get_hist_skeleton()
+    rep_trace, dem_trace = skeleton["data"]
+    return dict(
+        skeleton,
+        data=[
+            dict(rep_trace, x=centers, y=rep_counts, width=widths),
+            dict(dem_trace, x=centers, y=dem_counts, width=widths)
+        ],
+        layout=dict(skeleton["layout"], xaxis=dict(range=x_range))
     )
-    return fig
 
 
-def fig_rep_ec_vote_hist(data):
-    rep_ec_vote = 538 - data["dem_ec"]
+def fig_rep_state_vote_hist(data, state, general_election_win_color=False):
+    rep_win = data["dem_ec"].to_numpy() < 270 if general_election_win_color else None
+    return fig_rep_dem_hist(data_statistics.get_state_vote_histogram(data, state, rep_win))
 
-    a = rep_ec_vote.min() - 0.5
-    b = rep_ec_vote.max()
 
-    mid = 268.5
-    size = 4
+def fig_rep_n_states_win_hist(data):
+    return fig_rep_dem_hist(data_statistics.get_n_states_win_histogram(data, data["dem_ec"].to_numpy() < 270))
 
-    k_left = np.ceil((mid - a) / size)
-    bins_dict = dict(start=mid - size * k_left, end=b, size=size)
 
-    fig = _fig_rep_dem_hist(
-        rep_ec_vote[data["dem_ec"] < 270],
-        rep_ec_vote[data["dem_ec"] >= 270],
-        bins_dict
-    )
-    return fig
+def fig_rep_ec_vote_hist(data):
+    return fig_rep_dem_hist(data_statistics.get_ec_vote_histogram(data, data["dem_ec"].to_numpy() < 270))
 
 
 def fig_rep_natl_vote_hist(data):
-    rep_natl_pop_vote = 100 * (1 - data["natl_pop_vote"])
-    bins_dict = _get_bins_dict(rep_natl_pop_vote)
-
-    fig = _fig_rep_dem_hist(
-        rep_natl_pop_vote[data["dem_ec"] < 270],
-        rep_natl_pop_vote[data["dem_ec"] >= 270],
-        bins_dict
-    )
-    return fig
+    return fig_rep_dem_hist(data_statistics.get_natl_vote_histogram(data, data["dem_ec"].to_numpy() < 270))
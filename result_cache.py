@@ -0,0 +1,76 @@
+from collections import OrderedDict
+from threading import Lock
+import sys
+import numpy as np
+import pandas as pd
+
+
+def get_size(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (pd.Series, pd.DataFrame)):
+        return int(np.sum(value.memory_usage(index=True, deep=False)))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(get_size(k) + get_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(get_size(v) for v in value)
+    if hasattr(value, "__dict__"):
+        return sys.getsizeof(value) + get_size(vars(value))
+    return sys.getsizeof(value)
+
+
+# least recently used entries are evicted once the entries together take more than max_bytes
+class ResultCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    # membership tests do not count as hits or misses
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, n_bytes=None):
+        if n_bytes is None:
+            n_bytes = get_size(value)
+        with self.lock:
+            old_entry = self.entries.pop(key, None)
+            if old_entry is not None:
+                self.n_bytes -= old_entry[1]
+            if n_bytes > self.max_bytes:
+                return
+            self.entries[key] = (value, n_bytes)
+            self.n_bytes += n_bytes
+            while self.n_bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self.entries.popitem(last=False)
+                self.n_bytes -= evicted_bytes
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return dict(
+                entries=len(self.entries),
+                bytes=self.n_bytes,
+                max_bytes=self.max_bytes,
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions
+            )
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+import data_filters
+import data_functions
+import state_const
+
+
+# constraints as the inputs set them: typed shares, win buttons, national vote, electoral and states won
+constraint_sets = [
+    dict(states={"PA": (0.4523, 0.5587)}),
+    dict(states={"PA": (0.5001, 1), "FL": (0, 0.5)}),
+    dict(states={"GA": (0.47, 1), "AZ": (0.4612, 0.5299)}, natl=(0.45, 0.4871)),
+    dict(natl=(0.4619, 0.4733), ec=(270, 538)),
+    dict(states={"OH": (0.5, 0.6)}, ec=(200, 300), n_states=(20, 30)),
+]
+
+
+def get_constraints(constraint_set):
+    states = {s: (0, 1) for s in state_const.states}
+    states.update(constraint_set.get("states", {}))
+    return states, constraint_set.get("natl", (0, 1)), constraint_set.get("ec", (0, 538)), \
+        constraint_set.get("n_states", (0, 51))
+
+
+# shares are floored to 1e-4 and typed bounds rounded to it, a simulation whose republican share is
+# this close to a bound may land on either side of it
+margin = 1.5e-4
+
+
+# moves every typed share bound by the margin, widening the interval for a positive shift
+def shift_bounds(constraint_set, shift):
+    shifted = dict(constraint_set)
+    shifted["states"] = {s: (f - shift, t + shift) for s, (f, t) in constraint_set.get("states", {}).items()}
+    if "natl" in constraint_set:
+        shifted["natl"] = (constraint_set["natl"][0] - shift, constraint_set["natl"][1] + shift)
+    return shifted
+
+
+def filter_data(data, constraint_set):
+    mask = data_filters.get_constraints_mask(data, *get_constraints(constraint_set))
+    return data if mask is None else data.loc[mask]
+
+
+def test_unconstrained_statistics_are_exact(simulations):
+    for share_dtype in ("uint16", "float32"):
+        compact = data_functions.compact_data(simulations, share_dtype)
+        assert data_functions.win_statistics(compact) == data_functions.win_statistics(simulations)
+        assert np.array_equal(
+            data_functions.get_chance_dem_win(compact), data_functions.get_chance_dem_win(simulations)
+        )
+
+
+@pytest.mark.parametrize("share_dtype", ["uint16", "float32"])
+@pytest.mark.parametrize("constraint_set", constraint_sets)
+def test_filtered_views_match_float64(simulations, share_dtype, constraint_set):
+    compact = data_functions.compact_data(simulations, share_dtype)
+    expected = filter_data(simulations, constraint_set)
+    actual = filter_data(compact, constraint_set)
+
+    # the compact view lies between the float64 views with narrowed and widened bounds
+    narrow = filter_data(simulations, shift_bounds(constraint_set, -margin))
+    wide = filter_data(simulations, shift_bounds(constraint_set, margin))
+    assert len(expected) > 1000
+    assert narrow.index.isin(actual.index).all()
+    assert actual.index.isin(wide.index).all()
+    n_boundary = len(wide) - len(narrow)
+    assert n_boundary < len(expected) / 10
+
+    # a few rows more or less move the statistics of the view by at most their share of it
+    tolerance = 2 * n_boundary / len(expected) + 1e-12
+    expected_mean_ec, expected_dem, expected_rep = data_functions.win_statistics(expected)
+    actual_mean_ec, actual_dem, actual_rep = data_functions.win_statistics(actual)
+    assert abs(actual_mean_ec - expected_mean_ec) <= 538 * tolerance
+    for actual_side, expected_side in ((actual_dem, expected_dem), (actual_rep, expected_rep)):
+        assert abs(actual_side[0] - expected_side[0]) <= tolerance
+        if not np.isnan(expected_side[1]):
+            assert abs(actual_side[1] - expected_side[1]) <= 538 * tolerance
+    assert np.allclose(
+        data_functions.get_chance_dem_win(actual), data_functions.get_chance_dem_win(expected), atol=tolerance
+    )
+
+
+def test_win_masks_break_ties_like_the_bitmask(simulations):
+    data = simulations.drop(columns=data_functions.win_mask_column).head(1000).copy()
+    data.loc[data.index[:100], "PA"] = 0.5
+    with_bits = data.copy()
+    with_bits[data_functions.win_mask_column] = data_functions.get_dem_win_mask(data)
+    for mask in (data_filters.dem_state_win_mask, data_filters.rep_state_win_mask):
+        assert np.array_equal(mask(data, "PA"), mask(with_bits, "PA"))
+    assert data_filters.dem_state_win_mask(data, "PA")[:100].all()
@@ -0,0 +1,50 @@
+import os
+import numpy as np
+import pytest
+import data_cache
+from conftest import write_simulation_csvs
+
+
+def test_blank_lines_and_quoted_newlines_are_not_rows(tmp_path):
+    data = write_simulation_csvs(str(tmp_path), 1000)
+    with open(os.path.join(str(tmp_path), "sim0.csv"), "a") as f:
+        f.write("\n\n")
+    notes = data.iloc[:10].copy()
+    notes["note"] = "rerun\nafter fix"
+    notes.to_csv(os.path.join(str(tmp_path), "sim2.csv"), index_label="sim")
+
+    loaded, _, _ = data_cache.load_data(str(tmp_path))
+    assert len(loaded) == 1010
+    assert np.allclose(loaded[data_cache.share_columns].to_numpy()[:1000], data[data_cache.share_columns].to_numpy())
+
+
+def test_rebuild_matches_a_fresh_build(tmp_path, monkeypatch):
+    data_folder = tmp_path / "data"
+    data_folder.mkdir()
+    write_simulation_csvs(str(data_folder), 3000, n_files=3)
+    data_cache.load_data(str(data_folder))
+
+    # one file changes, the rows of the others are copied from the previous version
+    write_simulation_csvs(str(tmp_path), 1500, n_files=1, seed=1)
+    os.replace(str(tmp_path / "sim0.csv"), str(data_folder / "sim1.csv"))
+    rebuilt, version, cache_folder = data_cache.load_data(str(data_folder))
+
+    monkeypatch.setenv("ELECTION_CACHE_FOLDER", str(tmp_path / "fresh"))
+    fresh, fresh_version, _ = data_cache.load_data(str(data_folder))
+    assert version == fresh_version
+    assert len(rebuilt) == 3500
+    for column in fresh.columns:
+        assert np.array_equal(rebuilt[column].to_numpy(), fresh[column].to_numpy())
+    assert [p for p in os.listdir(cache_folder) if p.startswith(".build_")] == []
+
+
+def test_invalid_shares_are_recorded_at_ingest(tmp_path):
+    data = write_simulation_csvs(str(tmp_path), 1000)
+    bad = data.iloc[:10].copy()
+    bad.loc[bad.index[3], "PA"] = np.nan
+    bad.to_csv(os.path.join(str(tmp_path), "sim2.csv"), index_label="sim")
+
+    with pytest.raises(ValueError, match="missing vote shares in \\['sim2.csv'\\]"):
+        data_cache.load_data(str(tmp_path))
+    manifest = data_cache.read_manifest(data_cache.get_cache_folder(str(tmp_path)))
+    assert [s["missing_rows"] for s in manifest["sources"]] == [0, 0, 1]
@@ -0,0 +1,120 @@
+from collections import OrderedDict
+import numpy as np
+import pytest
+import data_filters
+import data_store
+from conftest import battleground_leans
+from data_model import DataModel
+
+
+def register_store(data, monkeypatch, share_dtype=None):
+    store = data_store.SimulationStore(data, "v1", share_dtype=share_dtype)
+    monkeypatch.setattr(data_store, "_stores", OrderedDict(v1=store))
+    return store
+
+
+@pytest.fixture
+def store(simulations, monkeypatch):
+    return register_store(simulations, monkeypatch)
+
+
+def test_sample_of_a_retired_store_version(simulations):
+    model = DataModel(simulations, "retired", 0)
+    model.add_state_vote_constraint("PA", 0.5, 1)
+    sample_id = model.get_random_sample_id()
+    assert model.get_sample_by_id(sample_id).equals(simulations.loc[[sample_id]])
+    assert len(model.get_sample_by_id(None)) == 0
+    assert len(model.get_sample_by_id(len(simulations))) == 0
+
+
+def test_views_are_cached_when_built_not_when_serialized(store):
+    model = DataModel.from_store(store, 0, 50000)
+    # a tighter interval filters the current view and caches the result at once
+    model.add_state_vote_constraint("PA", 0.5, 1)
+    assert store.has_selection(model._get_selection_key())
+
+    # a relaxed interval invalidates the view, it is built and cached on first read
+    model.add_state_vote_constraint("PA", 0.45, 1)
+    key = model._get_selection_key()
+    model.to_json()
+    assert not store.has_selection(key)
+    view = model.data
+    assert store.has_selection(key)
+
+    other = DataModel.from_json(model.to_json())
+    assert other.data.index.equals(view.index)
+
+
+# typed intervals of every width, win buttons and the full interval, around the republican share of the simulations
+def random_interval(rng, name):
+    if name == "dem_ec":
+        return tuple(sorted(int(v) for v in rng.randint(150, 400, 2)))
+    if name == "n_states_won":
+        return tuple(sorted(int(v) for v in rng.randint(15, 35, 2)))
+    choice = rng.randint(5)
+    if choice == 0:
+        return 0, 1
+    if choice == 1:
+        return (0, 0.5) if rng.randint(2) else (0.5001, 1)
+    center = 0.48 if name == "natl_pop_vote" else 1 - battleground_leans[name]
+    width = rng.choice([0.002, 0.01, 0.05, 0.2])
+    f = round(center + rng.uniform(-0.04, 0.04) - width / 2, 4)
+    return max(f, 0), min(round(f + width, 4), 1)
+
+
+# half of the changes narrow the current interval, the tighten path of the model
+def change_constraint(rng, model):
+    name = rng.choice(list(battleground_leans) + ["natl_pop_vote", "dem_ec", "n_states_won"])
+    f, t = model._get_interval(name)
+    if rng.randint(2) and f < t:
+        f, t = sorted(rng.uniform(f, t, 2))
+        if name in ("dem_ec", "n_states_won"):
+            f, t = int(np.ceil(f)), int(np.floor(t))
+        else:
+            f, t = round(f, 4), round(t, 4)
+    else:
+        f, t = random_interval(rng, name)
+    if name == "natl_pop_vote":
+        model.add_natl_vote_constraint(f, t)
+    elif name == "dem_ec":
+        model.add_ec_vote_constraint(f, t)
+    elif name == "n_states_won":
+        model.add_states_win_constraint(f, t)
+    else:
+        model.add_state_vote_constraint(name, f, t)
+
+
+@pytest.mark.parametrize("share_dtype", [None, "uint16", "float32"])
+def test_incremental_views_match_a_fresh_filter(simulations, monkeypatch, share_dtype):
+    store = register_store(simulations, monkeypatch, share_dtype)
+    model = DataModel.from_store(store, 0, 50000)
+    data = model.original_data
+    column_index = store.get_sample_index(0, 50000)
+    rng = np.random.RandomState(0)
+    n_index_checks = 0
+    for step in range(150):
+        action = rng.randint(10)
+        if action == 0:
+            model.reset_data()
+        elif action < 4:
+            with model.batch():
+                for _ in range(rng.randint(1, 4)):
+                    change_constraint(rng, model)
+        else:
+            change_constraint(rng, model)
+
+        constraints = (
+            model.rep_state_vote_constraints,
+            model.rep_natl_vote_constraint,
+            model.rep_ec_vote_constraint,
+            model.rep_states_win_constraint
+        )
+        mask = data_filters.get_constraints_mask(data, *constraints)
+        expected = np.arange(len(data)) if mask is None else np.flatnonzero(mask)
+        assert np.array_equal(model.data.index, data.index[expected]), (step, constraints)
+
+        rows = data_filters.get_constraints_rows(data, column_index, *constraints)
+        if rows is not None:
+            assert np.array_equal(rows, expected), (step, constraints)
+            n_index_checks += 1
+    assert n_index_checks > 20
@@ -0,0 +1,31 @@
+import os
+import signal
+import numpy as np
+import pytest
+import data_parallel
+
+
+@pytest.fixture
+def split_frames(monkeypatch):
+    monkeypatch.setattr(data_parallel, "parallel_threads", 2)
+    monkeypatch.setattr(data_parallel, "parallel_min_rows", 1)
+
+
+def test_chunks_cover_the_rows(split_frames):
+    values = np.arange(1001)
+    assert data_parallel.sum_chunks(lambda rows: values[rows].sum(), len(values)) == values.sum()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_forked_worker_gets_its_own_executor(split_frames):
+    values = np.arange(1001)
+    # the master uses the executor before forking, like the preloaded app does
+    data_parallel.sum_chunks(lambda rows: values[rows].sum(), len(values))
+    pid = os.fork()
+    if pid == 0:
+        # a worker stuck on the threads of the master is killed instead of hanging the test
+        signal.alarm(10)
+        ok = data_parallel.sum_chunks(lambda rows: values[rows].sum(), len(values)) == values.sum()
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
@@ -0,0 +1,32 @@
+import numpy as np
+import data_statistics
+
+
+def test_histograms_are_built_on_first_use(simulations):
+    calls = []
+
+    def get_data():
+        calls.append(1)
+        return simulations
+
+    statistics = data_statistics.ViewStatistics(simulations)
+    assert len(calls) == 0
+    for _ in range(2):
+        histograms = [
+            statistics.get_natl_vote_histogram(get_data),
+            statistics.get_ec_vote_histogram(get_data),
+            statistics.get_n_states_win_histogram(get_data),
+            statistics.get_state_vote_histogram("PA", get_data),
+        ]
+    assert len(calls) == 4
+
+    rep_win = simulations["dem_ec"].to_numpy() < 270
+    expected = [
+        data_statistics.get_natl_vote_histogram(simulations, rep_win),
+        data_statistics.get_ec_vote_histogram(simulations, rep_win),
+        data_statistics.get_n_states_win_histogram(simulations, rep_win),
+        data_statistics.get_state_vote_histogram(simulations, "PA", rep_win),
+    ]
+    for histogram, expected_histogram in zip(histograms, expected):
+        for a, b in zip(histogram, expected_histogram):
+            assert np.array_equal(a, b)
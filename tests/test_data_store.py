@@ -0,0 +1,80 @@
+import fcntl
+import os
+import tracemalloc
+from collections import OrderedDict
+import pytest
+import data_store
+from conftest import write_simulation_csvs
+
+
+@pytest.fixture
+def unwritable_cache(tmp_path, monkeypatch):
+    # the cache folder would have to be created below a file
+    blocker = tmp_path / "blocker"
+    blocker.write_text("")
+    monkeypatch.setenv("ELECTION_CACHE_FOLDER", str(blocker / "cache"))
+    monkeypatch.setattr(data_store, "_store", None)
+    monkeypatch.setattr(data_store, "_stores", OrderedDict())
+    data_folder = tmp_path / "data"
+    data_folder.mkdir()
+    monkeypatch.setattr(data_store, "data_folder", str(data_folder))
+    return str(data_folder)
+
+
+def test_private_cache_is_checked_and_reused(unwritable_cache):
+    write_simulation_csvs(unwritable_cache, 1000)
+    store = data_store.get_store()
+    assert store.has_private_cache()
+
+    # unchanged files, the store is kept
+    data_store.check_for_updates()
+    assert data_store.get_store() is store
+
+    write_simulation_csvs(unwritable_cache, 1200, n_files=3, seed=1)
+    data_store.check_for_updates()
+    new_store = data_store.get_store()
+    assert new_store is not store and len(new_store) == 1200
+    assert new_store.cache_folder == store.cache_folder
+    assert os.listdir(new_store.cache_folder).count(new_store.version) == 1
+    assert store.version not in os.listdir(new_store.cache_folder)
+
+
+def test_private_cache_is_removed_when_replaced(unwritable_cache, monkeypatch, tmp_path):
+    write_simulation_csvs(unwritable_cache, 1000)
+    store = data_store.get_store()
+
+    monkeypatch.setenv("ELECTION_CACHE_FOLDER", str(tmp_path / "cache"))
+    new_store = data_store.reload_store()
+    assert not new_store.has_private_cache()
+    assert not os.path.exists(store.cache_folder)
+
+
+def test_load_does_not_copy_the_cache(tmp_path):
+    write_simulation_csvs(str(tmp_path), 100000)
+    data_store.SimulationStore.load(str(tmp_path))
+
+    tracemalloc.start()
+    try:
+        store = data_store.SimulationStore.load(str(tmp_path))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    data_bytes = int(store.data.memory_usage(index=False).sum())
+    assert peak < data_bytes / 20, (peak, data_bytes)
+
+
+def test_workers_leave_the_rebuild_to_its_owner(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_store, "_store", None)
+    monkeypatch.setattr(data_store, "_stores", OrderedDict())
+    monkeypatch.setattr(data_store, "data_folder", str(tmp_path))
+    write_simulation_csvs(str(tmp_path), 1000)
+    store = data_store.get_store()
+
+    write_simulation_csvs(str(tmp_path), 1200, n_files=3, seed=1)
+    # another process is building the new version
+    with open(os.path.join(store.cache_folder, ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        data_store.check_for_updates()
+        assert data_store.get_store() is store
+    data_store.check_for_updates()
+    assert len(data_store.get_store()) == 1200
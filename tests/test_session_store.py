@@ -0,0 +1,181 @@
+import json
+import time
+from contextlib import nullcontext
+from threading import Barrier, Lock, Thread
+import fakeredis
+import pytest
+from flask import Flask, g
+from redis.client import Pipeline
+from app import session_store
+from app.session_store import SessionConflict, SessionUnitOfWork
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    monkeypatch.setattr(session_store, "init_poll_interval", 0.001)
+    return fakeredis.FakeRedis()
+
+
+# the mappings written by every HSET of a commit
+@pytest.fixture
+def hset_calls(monkeypatch):
+    calls = []
+    hset = Pipeline.hset
+
+    def record_hset(self, name, *args, mapping=None, **kwargs):
+        calls.append(dict(mapping))
+        return hset(self, name, *args, mapping=mapping, **kwargs)
+
+    monkeypatch.setattr(Pipeline, "hset", record_hset)
+    return calls
+
+
+def write(redis, sid, **values):
+    uow = SessionUnitOfWork(redis, sid)
+    for field, value in values.items():
+        uow[field] = value
+    uow.commit()
+
+
+def test_stale_read_conflicts_and_is_retried(redis):
+    write(redis, "s", count=1)
+    app = Flask(__name__)
+    calls = []
+
+    @session_store.transaction
+    def increment():
+        session = session_store.get_session()
+        count = session["count"]
+        if len(calls) == 0:
+            # another request commits between this read and the commit
+            write(redis, "s", count=count + 100)
+        calls.append(count)
+        session["count"] = count + 1
+
+    with app.test_request_context(headers={"Cookie": f"{session_store.cookie_name}=s"}):
+        g.session_redis = redis
+        g.session_uow = None
+        increment()
+
+    assert calls == [1, 101]
+    assert SessionUnitOfWork(redis, "s")["count"] == 102
+
+
+def test_reads_from_different_versions_conflict(redis):
+    write(redis, "s", a=1, b=2)
+    uow = SessionUnitOfWork(redis, "s")
+    assert uow["a"] == 1
+    write(redis, "s", b=3)
+    assert uow["b"] == 3
+    uow["a"] = 4
+    with pytest.raises(SessionConflict):
+        uow.commit()
+
+
+def test_blind_write_skips_the_version_check(redis):
+    write(redis, "s", a=1)
+    uow = SessionUnitOfWork(redis, "s")
+    write(redis, "s", a=2)
+    uow["b"] = 3
+    uow.commit()
+
+    other = SessionUnitOfWork(redis, "s")
+    assert (other["a"], other["b"]) == (2, 3)
+    assert other.version == 3
+
+
+def test_commit_writes_only_changed_fields(redis, hset_calls):
+    write(redis, "s", a=1, b=[1, 2], c="x")
+    hset_calls.clear()
+
+    uow = SessionUnitOfWork(redis, "s")
+    uow.prefetch("a", "b", "c")
+    uow["a"] = 2
+    # same value as read, not written
+    uow["b"] = [1, 2]
+    uow.commit()
+    assert [sorted(m) for m in hset_calls] == [["_version", "a"]]
+
+    # nothing changed, no round trip
+    uow.commit()
+    assert len(hset_calls) == 1
+
+
+def test_compressed_round_trip(redis):
+    large = {"selected": ["PA"] * 1000, "limits": list(range(500))}
+    write(redis, "s", large=large, small=[1, 2])
+    key = "election_session:s"
+    assert redis.hget(key, "large")[:1] == b"z"
+    assert len(redis.hget(key, "large")) < len(json.dumps(large)) / 4
+    assert redis.hget(key, "small")[:1] == b"j"
+
+    uow = SessionUnitOfWork(redis, "s")
+    assert uow["large"] == large and uow["small"] == [1, 2]
+    # the decoded value compares equal to the stored one, so it is not written again
+    uow["large"] = dict(large)
+    assert len(uow.dirty) == 0
+
+
+def initialize_concurrently(redis, n):
+    calls = []
+    calls_lock = Lock()
+    results = [None] * n
+    barrier = Barrier(n)
+
+    def init(uow):
+        with calls_lock:
+            calls.append(uow)
+        # long enough for the other callers to find the lock taken
+        time.sleep(0.05)
+        uow["data"] = [1, 2, 3]
+        uow["initialized"] = True
+        return "initialized"
+
+    def run(i):
+        uow = SessionUnitOfWork(fakeredis.FakeRedis(server=redis.connection_pool.connection_kwargs["server"]), "s")
+        barrier.wait()
+        result = uow.initialize_once("initialized", lambda: init(uow), ["initialized", "data"])
+        results[i] = (result, uow["data"])
+
+    threads = [Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return calls, results
+
+
+def test_initialize_once_in_one_worker(redis):
+    calls, results = initialize_concurrently(redis, 8)
+    assert len(calls) == 1
+    assert [r for r, _ in results].count("initialized") == 1
+    assert [r for r, _ in results].count(None) == 7
+    assert all(data == [1, 2, 3] for _, data in results)
+    assert redis.get("election_session:s:init") is None
+
+
+def test_initialize_once_across_workers(redis, monkeypatch):
+    # every caller as if in its own worker, only the lock in redis keeps them apart
+    monkeypatch.setattr(session_store, "local_init_lock", lambda sid: nullcontext())
+    calls, results = initialize_concurrently(redis, 8)
+    assert len(calls) == 1
+    assert [r for r, _ in results].count("initialized") == 1
+    assert [r for r, _ in results].count(None) == 7
+    assert all(data == [1, 2, 3] for _, data in results)
+
+
+def test_initialize_once_takes_over_an_expired_lock(redis, monkeypatch):
+    # a request took the lock and died before initializing the session
+    redis.set("election_session:s:init", "dead", px=200)
+    write(redis, "s", other=1)
+    uow = SessionUnitOfWork(redis, "s")
+    start = time.time()
+
+    def init():
+        uow["initialized"] = True
+        return "initialized"
+
+    assert uow.initialize_once("initialized", init, ["initialized"]) == "initialized"
+    assert 0.15 < time.time() - start < session_store.init_lock_timeout
+    assert SessionUnitOfWork(redis, "s")["initialized"] is True
+    assert redis.get("election_session:s:init") is None
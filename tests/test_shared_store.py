@@ -0,0 +1,75 @@
+import os
+import numpy as np
+import pytest
+import data_store
+from conftest import write_simulation_csvs
+
+
+pytestmark = pytest.mark.skipif(
+    not os.path.exists("/proc/self/smaps_rollup"), reason="needs /proc/<pid>/smaps_rollup"
+)
+
+
+def read_smaps_rollup(pid):
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return values
+
+
+# forks n workers from the preloaded store, every worker reads all of the simulations,
+# returns the memory of each worker measured while all of them are alive
+def fork_workers(store, n):
+    workers = []
+    for _ in range(n):
+        ready_r, ready_w = os.pipe()
+        release_r, release_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # only the parent may hold the write end, the worker exits when it is closed
+            for fd in [release_w, ready_r] + [fd for _, r, w in workers for fd in (r, w)]:
+                os.close(fd)
+            for block in store.data._mgr.blocks:
+                np.asarray(block.values).sum()
+            os.write(ready_w, b"1")
+            os.read(release_r, 1)
+            os._exit(0)
+        os.close(ready_w)
+        os.close(release_r)
+        workers.append((pid, ready_r, release_w))
+
+    memory = []
+    try:
+        for pid, ready_r, _ in workers:
+            assert os.read(ready_r, 1) == b"1"
+        memory = [read_smaps_rollup(pid) for pid, _, _ in workers]
+    finally:
+        for pid, ready_r, release_w in workers:
+            os.close(release_w)
+            os.close(ready_r)
+        for pid, _, _ in workers:
+            os.waitpid(pid, 0)
+    return memory
+
+
+def test_worker_memory_stays_flat(tmp_path):
+    write_simulation_csvs(str(tmp_path), 100000)
+    store = data_store.SimulationStore.load(str(tmp_path))
+    data_bytes = int(store.data.memory_usage(index=False).sum())
+
+    private = {}
+    for n in (1, 2, 4):
+        memory = fork_workers(store, n)
+        # every worker has all of the simulations in its resident pages
+        assert all(m["Rss"] > data_bytes for m in memory)
+        # a copy of the simulations would be dirty, clean pages of the cache file are shared
+        # through the page cache even when only one process has touched them so far
+        private[n] = max(m["Private_Dirty"] for m in memory)
+
+    # but none of them holds a copy
+    for n, n_bytes in private.items():
+        assert n_bytes < data_bytes / 4, (n, n_bytes, data_bytes)
+    assert private[4] < private[1] + data_bytes / 10, private